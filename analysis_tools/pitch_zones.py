@@ -11,6 +11,9 @@ add_pitch_zones(pitch)
 
 get_key_zones(zone_type='jdp_custom', halfspace=True, zone_14=True, cross_areas=False, split_lr=False):
     Return zone numbers for key zones of pitch.
+
+zone_grid_edges(bin_statistic):
+    Return ascending bin edges of a mplsoccer zone grid, and whether its statistic rows run in descending y order.
 """
 
 import numpy as np
@@ -852,3 +855,29 @@ def get_key_zones(zone_type='jdp_custom', halfspace=True, zone_14=True, cross_ar
                 zone_numbers['r_cross_area'] = [22, 25]
 
     return zone_numbers
+
+
+def zone_grid_edges(bin_statistic):
+    """ Return ascending bin edges of a mplsoccer zone grid, and whether its statistic rows run in descending y order.
+
+    mplsoccer returns the y edges of a bin_statistic grid in a version dependent order. From mplsoccer 1.1.4, y_grid
+    (and the rows of statistic) run from the top of the pitch downwards, whereas earlier versions run from the bottom
+    upwards. This function returns x and y edges in ascending order, for use with np.digitize, np.histogram2d or bounds
+    checks, along with a flag indicating whether the rows of statistic are in descending y order. If the flag is set,
+    a row index found from the ascending y edges must be flipped (row = n_rows - 1 - row), or an array of rows binned
+    on the ascending edges flipped on the row axis, to match the layout of statistic used by pitch.heatmap.
+
+    Args:
+        bin_statistic (dict): mplsoccer bin_statistic output, containing 'x_grid' and 'y_grid'.
+
+    Returns:
+        numpy.ndarray: x bin edges, in ascending order.
+        numpy.ndarray: y bin edges, in ascending order.
+        bool: True if the rows of statistic run in descending y order, False otherwise.
+    """
+
+    xedges = bin_statistic['x_grid'][0]
+    yedges = bin_statistic['y_grid'][:, 0]
+    flip_rows = bool(yedges[0] > yedges[-1])
+
+    return np.sort(xedges), np.sort(yedges), flip_rows
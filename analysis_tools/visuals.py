@@ -2,7 +2,60 @@
 
 Functions
 ---------
+add_chrome(fig, title_text, subtitle_text, subsubtitle_text, highlight_textprops, comp_logo, twitter_logo,
+           title_fontsize=16, subtitle_fontweight='regular', footer_x=0.5):
+    Add titles, direction of play arrow, footer and logos to a pitch grid figure.
+"""
 
+import highlight_text as htext
 
-"""
 
+def add_chrome(fig, title_text, subtitle_text, subsubtitle_text, highlight_textprops, comp_logo, twitter_logo,
+               title_fontsize=16, subtitle_fontweight='regular', footer_x=0.5):
+    """ Add titles, direction of play arrow, footer and logos to a pitch grid figure.
+
+    Function to add the standard surrounding layout to a figure containing a grid of pitches (e.g. a top 12 players
+    plot). The subtitle uses highlighted text as the figure legend. Logos are passed in as pre-loaded images, so that
+    each logo file is decoded once and re-used across figures.
+
+    Args:
+        fig (matplotlib.figure.Figure): figure to add titles, footer and logos to.
+        title_text (string): figure title.
+        subtitle_text (string): figure subtitle, with highlighted sections enclosed in <>.
+        subsubtitle_text (string): text below the subtitle, e.g. date of data.
+        highlight_textprops (list): text properties for each highlighted section of subtitle_text.
+        comp_logo (PIL.Image.Image or numpy.ndarray): competition logo, drawn at the top left of the figure.
+        twitter_logo (PIL.Image.Image or numpy.ndarray): twitter logo, drawn at the bottom right of the figure.
+        title_fontsize (float, optional): font size of title. 16 by default.
+        subtitle_fontweight (string, optional): font weight of subtitle. 'regular' by default.
+        footer_x (float, optional): horizontal figure position of the centre of the footer text. 0.5 by default.
+
+    Returns:
+        None
+    """
+
+    # Create title and subtitles, using highlighting as figure legend
+    fig.text(0.1, 0.945, title_text, fontweight="bold", fontsize=title_fontsize, color='w')
+    htext.fig_text(0.1, 0.93, s=subtitle_text, fontweight=subtitle_fontweight, fontsize=13, color='w',
+                   highlight_textprops=highlight_textprops)
+    fig.text(0.1, 0.8875, subsubtitle_text, fontweight="regular", fontsize=10, color='w')
+
+    # Add direction of play arrow
+    arrow_ax = fig.add_axes([0.042, 0.05, 0.18, 0.01])
+    arrow_ax.axis("off")
+    arrow_ax.arrow(0.51, 0.15, 0.1, 0, color="white")
+    fig.text(0.13, 0.03, "Direction of play", ha="center", fontsize=10, color="white", fontweight="regular")
+
+    # Add footer text
+    fig.text(footer_x, 0.04, "Created by Jake Kolliari (@_JKDS_). Data provided by Opta.",
+             fontstyle="italic", ha="center", fontsize=9, color="white")
+
+    # Add competition logo
+    comp_ax = fig.add_axes([0.015, 0.877, 0.1, 0.1])
+    comp_ax.axis("off")
+    comp_ax.imshow(comp_logo)
+
+    # Add twitter logo
+    logo_ax = fig.add_axes([0.92, 0.025, 0.04, 0.04])
+    logo_ax.axis("off")
+    logo_ax.imshow(twitter_logo)
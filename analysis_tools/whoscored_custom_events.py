@@ -11,6 +11,15 @@ progressive_action(single_event, inplay=True, successful_only=True)
 box_entry(single_event, inplay=True, successful_only=True):
     Identify pass or carry into box from whoscored-style event.
 
+progressive_action_vec(events_df, inplay=True, successful_only=True):
+    Identify progressive passes and carries across a whoscored-style events dataframe.
+
+box_entry_vec(events_df, inplay=True, successful_only=True):
+    Identify passes and carries into the box across a whoscored-style events dataframe.
+
+qualifier_bitmask(events_df, qualifier_bits):
+    Pack selected qualifiers of each event in a whoscored-style events dataframe into a bitmask.
+
 create_convex_hull(events_df, name='default', min_events=3, include_percent=100, pitch_area = 10000):
     Create a dataframe of convex hull information from statsbomb-style event data.
 
@@ -38,6 +47,7 @@ get_possession_chains(events_df, chain_check=5, suc_evts_in_chain=3):
 
 import numpy as np
 import pandas as pd
+from itertools import chain
 from scipy.spatial import ConvexHull
 from scipy.interpolate import interp2d
 from scipy.spatial import Delaunay
@@ -195,7 +205,120 @@ def box_entry(single_event, inplay=True, successful_only=True):
 
     else:
         return float('nan')
-    
+
+
+def progressive_action_vec(events_df, inplay=True, successful_only=True):
+    """ Identify progressive passes and carries across a whoscored-style events dataframe.
+
+    Vectorised equivalent of progressive_action, which evaluates the same progressive action criteria over whole
+    columns of a whoscored-style events dataframe rather than one event at a time. Returns a boolean array aligned
+    positionally with the rows of the events dataframe.
+
+    Args:
+        events_df (pandas.DataFrame): whoscored-style dataframe of event data. Events can be from multiple matches.
+        inplay (bool, optional): selection of whether to include 'in-play' events only. True by default.
+        successful_only (bool, optional): selection of whether to only include successful actions. True by default
+
+    Returns:
+        numpy.ndarray: boolean array, True = progressive action, False = non-progressive action, unsuccessful action
+        or not a pass/carry.
+    """
+
+    # Determine if event is pass or carry, and check success and in-play status
+    check_action = events_df['eventType'].isin(['Carry', 'Pass']).to_numpy()
+    if successful_only:
+        check_action = check_action & (events_df['outcomeType'] == 'Successful').to_numpy()
+    if inplay:
+        set_piece_types = frozenset([48, 50, 51, 42, 44, 45, 31, 34, 212])
+        check_action = check_action & events_df['satisfiedEventsTypes'].map(
+            set_piece_types.isdisjoint).to_numpy(dtype=bool)
+
+    # Determine start and end positions in yards (assuming standard pitch) for candidate actions only
+    candidates = np.flatnonzero(check_action)
+    x_startpos = 120*events_df['x'].to_numpy()[candidates]/100
+    y_startpos = 80*events_df['y'].to_numpy()[candidates]/100
+    x_endpos = 120*events_df['endX'].to_numpy()[candidates]/100
+    y_endpos = 80*events_df['endY'].to_numpy()[candidates]/100
+    delta_goal_dist = np.hypot(120 - x_startpos, 40 - y_startpos) - np.hypot(120 - x_endpos, 40 - y_endpos)
+
+    # Apply distance criteria for actions within own half, between halves, and within opposition half
+    progressive = np.zeros(len(events_df), dtype=bool)
+    progressive[candidates] = (((x_startpos < 60) & (x_endpos < 60) & (delta_goal_dist >= 32.8)) |
+                               ((x_startpos < 60) & (x_endpos >= 60) & (delta_goal_dist >= 16.4)) |
+                               ((x_startpos >= 60) & (x_endpos >= 60) & (delta_goal_dist >= 10.94)))
+
+    return progressive
+
+
+def box_entry_vec(events_df, inplay=True, successful_only=True):
+    """ Identify passes and carries into the box across a whoscored-style events dataframe.
+
+    Vectorised equivalent of box_entry, which evaluates the same box entry criteria over whole columns of a
+    whoscored-style events dataframe rather than one event at a time. Returns a boolean array aligned positionally
+    with the rows of the events dataframe.
+
+    Args:
+        events_df (pandas.DataFrame): whoscored-style dataframe of event data. Events can be from multiple matches.
+        inplay (bool, optional): selection of whether to include 'in-play' events only. True by default.
+        successful_only (bool, optional): selection of whether to only include successful events. True by default
+
+    Returns:
+        numpy.ndarray: boolean array, True = action into the box, False = not box action, unsuccessful action or not a
+        pass/carry.
+    """
+
+    # Determine if event is pass or carry, and check success and in-play status
+    check_action = events_df['eventType'].isin(['Pass', 'Carry']).to_numpy()
+    if successful_only:
+        check_action = check_action & (events_df['outcomeType'] == 'Successful').to_numpy()
+    if inplay:
+        set_piece_types = frozenset([48, 50, 51, 42, 44, 45, 31, 34, 212])
+        check_action = check_action & events_df['satisfiedEventsTypes'].map(
+            set_piece_types.isdisjoint).to_numpy(dtype=bool)
+
+    # Check whether action moves ball into the box
+    x_position = events_df['x'].to_numpy()
+    y_position = events_df['y'].to_numpy()
+    x_position_end = events_df['endX'].to_numpy()
+    y_position_end = events_df['endY'].to_numpy()
+    into_box = ((x_position_end >= 83) & (y_position_end >= 21.1) & (y_position_end <= 78.9) &
+                ((x_position < 83) | (y_position < 21.1) | (y_position > 78.9)))
+
+    return check_action & into_box
+
+
+def qualifier_bitmask(events_df, qualifier_bits):
+    """ Pack selected qualifiers of each event in a whoscored-style events dataframe into a bitmask.
+
+    Function to map each qualifier id in the satisfiedEventsTypes column to a bit, and combine the bits of all
+    qualifiers of an event with bitwise OR. Several qualifier ids can share a bit, so that one bit test replaces a set
+    membership check per event. All qualifier ids of all events are processed in a single flat pass, rather than one
+    event at a time. Returns a uint8 array aligned positionally with the rows of the events dataframe.
+
+    Args:
+        events_df (pandas.DataFrame): whoscored-style dataframe of event data. Events can be from multiple matches.
+        qualifier_bits (dict): mapping from qualifier id to bit value (1, 2, 4, ... 128). Unlisted ids set no bits.
+
+    Returns:
+        numpy.ndarray: uint8 array, with the bits of each event's listed qualifiers set.
+    """
+
+    # Build lookup table from qualifier id to bit
+    bit_lut = np.zeros(max(qualifier_bits) + 1, dtype=np.uint8)
+    bit_lut[list(qualifier_bits)] = list(qualifier_bits.values())
+
+    # Flatten qualifier ids of all events, and look up their bits (ids beyond the table set no bits)
+    sat_types = events_df['satisfiedEventsTypes']
+    n_types = np.fromiter(map(len, sat_types), dtype=int, count=len(sat_types))
+    type_ids = np.fromiter(chain.from_iterable(sat_types), dtype=int, count=n_types.sum())
+    type_bits = np.where(type_ids < len(bit_lut), bit_lut[np.minimum(type_ids, len(bit_lut) - 1)], 0).astype(np.uint8)
+
+    # Combine bits per event
+    sat_flags = np.zeros(len(sat_types), dtype=np.uint8)
+    np.bitwise_or.at(sat_flags, np.repeat(np.arange(len(sat_types)), n_types), type_bits)
+
+    return sat_flags
+
 
 def create_convex_hull(events_df, name='default', min_events=3, include_events='1std', pitch_area=10000):
     """ Create a dataframe of convex hull information from statsbomb-style event data.
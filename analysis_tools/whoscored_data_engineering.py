@@ -25,9 +25,25 @@ create_player_list(lineups, additional_cols=None):
 
 group_player_events(events, player_data, group_type='count', agg_columns=None, primary_event_name='Column Name'):
     Aggregate event types per player, and add to player info
+
+get_cache_path(file_path, files, cache_name, signature=None):
+    Get the path of a cache file for data derived from a set of WhoScored data files.
+
+load_cached_data(file_path, files, cache_name, build_data, event_cols=None, player_cols=None, version=None):
+    Load event and player data from a parquet cache, building and caching the data if no valid cache exists.
+
+load_files(file_path, files):
+    Decompress and unpickle a set of WhoScored data files in parallel.
     
 """
 
+import os
+import io
+import bz2
+import pickle
+import types
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 
@@ -432,3 +448,106 @@ def group_player_events(events, player_data, group_type='count', agg_columns=Non
     return player_data_out
 
 
+def get_cache_path(file_path, files, cache_name, signature=None):
+    """ Get the path of a cache file for data derived from a set of WhoScored data files.
+
+    Function to build a cache file path that is unique to a set of WhoScored data files and their latest modification
+    time, so that loaded and processed data can be stored once (e.g. as parquet) and re-used on subsequent runs. Any
+    change to the set of source files, or to their contents, results in a new cache path. An optional signature of the
+    processing applied to the data can be included, so that a change to the processing also results in a new cache
+    path.
+
+    Args:
+        file_path (string): path to the folder containing the WhoScored data files.
+        files (list): names of the WhoScored data files that the cached data is derived from.
+        cache_name (string): name describing the cached data, used as the start of the cache file name.
+        signature (string, optional): description of the processing applied to the cached data. Defaults to None.
+
+    Returns:
+        string: path of the cache file within a 'cache' sub-folder of file_path, excluding file extension.
+    """
+
+    # Key cache on file names, latest modification time and processing signature
+    latest_mtime = max(os.path.getmtime(f"{file_path}/{file}") for file in files)
+    cache_key = hashlib.sha1(('|'.join(sorted(files)) + str(latest_mtime) + str(signature)).encode()).hexdigest()[:12]
+
+    return f"{file_path}/cache/{cache_name}-{cache_key}"
+
+
+def load_files(file_path, files):
+    """ Decompress and unpickle a set of WhoScored data files in parallel.
+
+    Function to load bz2-compressed pickle files (.pbz2) using a pool of threads. bz2 releases the GIL while
+    decompressing, so files are loaded concurrently, and a 1 MiB read buffer keeps pickle from issuing many small reads
+    against the decompressor.
+
+    Args:
+        file_path (string): path to the folder containing the WhoScored data files.
+        files (list): names of the WhoScored data files to load.
+
+    Returns:
+        list: unpickled data from each file, in the same order as files.
+    """
+
+    def load_file(file):
+        with io.BufferedReader(bz2.BZ2File(f"{file_path}/{file}", 'rb'), buffer_size=1 << 20) as f:
+            return pickle.load(f)
+
+    with ThreadPoolExecutor() as executor:
+        return list(executor.map(load_file, files))
+
+
+def load_cached_data(file_path, files, cache_name, build_data, event_cols=None, player_cols=None, version=None):
+    """ Load event and player data from a parquet cache, building and caching the data if no valid cache exists.
+
+    Function to re-use loaded and processed WhoScored data across runs. The cache is keyed on the source files and on a
+    signature of the processing, made up of the compiled code of build_data, the cached columns and version. Editing
+    build_data therefore invalidates the cache, while version should be changed when processing outside of build_data
+    (e.g. an analysis_tools function that it calls) changes the cached data.
+
+    Args:
+        file_path (string): path to the folder containing the WhoScored data files.
+        files (list): names of the WhoScored data files that the cached data is derived from.
+        cache_name (string): name describing the cached data, used as the start of the cache file name.
+        build_data (function): function taking file_path and files, and returning processed events and players
+            dataframes.
+        event_cols (list, optional): event columns to cache. Defaults to None, which caches all columns.
+        player_cols (list, optional): player columns to cache. Defaults to None, which caches all columns.
+        version (string, optional): version of processing outside of build_data. Defaults to None.
+
+    Returns:
+        pandas.DataFrame: events dataframe, containing event_cols.
+        pandas.DataFrame: players dataframe, containing player_cols.
+    """
+
+    # Describe compiled code, including nested functions, independently of hash randomisation of set constants
+    def code_signature(code):
+        parts = [code.co_code.hex(), repr(code.co_names)]
+        for const in code.co_consts:
+            if isinstance(const, types.CodeType):
+                parts.append(code_signature(const))
+            elif isinstance(const, frozenset):
+                parts.append(repr(sorted(const, key=repr)))
+            else:
+                parts.append(repr(const))
+        return '|'.join(parts)
+
+    signature = '|'.join([code_signature(build_data.__code__), repr(event_cols), repr(player_cols), str(version)])
+    cache_path = get_cache_path(file_path, files, cache_name, signature=signature)
+
+    # Read from cache if valid, otherwise build, select columns and cache
+    if os.path.exists(f"{cache_path}-events.parquet") and os.path.exists(f"{cache_path}-players.parquet"):
+        events_df = pd.read_parquet(f"{cache_path}-events.parquet")
+        players_df = pd.read_parquet(f"{cache_path}-players.parquet")
+    else:
+        events_df, players_df = build_data(file_path, files)
+        if event_cols is not None:
+            events_df = events_df[event_cols]
+        if player_cols is not None:
+            players_df = players_df[player_cols]
+
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        events_df.to_parquet(f"{cache_path}-events.parquet", compression='zstd')
+        players_df.to_parquet(f"{cache_path}-players.parquet", compression='zstd')
+
+    return events_df, players_df
@@ -23,6 +23,7 @@ import mpl_toolkits.axisartist.floating_axes as floating_axes
 from mpl_toolkits.axisartist.grid_finder import (FixedLocator, MaxNLocator, DictFormatter)
 import matplotlib.patheffects as path_effects
 import matplotlib.cm as cm
+from matplotlib.collections import LineCollection
 from PIL import Image, ImageEnhance
 import adjustText
 import os
@@ -30,10 +31,23 @@ import sys
 import bz2
 import pickle
 import numpy as np
-import highlight_text as htext
 import glob
 from mplsoccer.pitch import Pitch
 
+# %% Function definitions
+
+
+def add_pass_lines(ax, x, y, end_x, end_y, color, alpha=None, zorder=1):
+    """ Draw passes as a flat line collection, with a thicker collection over the final 20% of each pass to
+    give the tapered look of a comet line at a fraction of the stroke count."""
+    start = np.column_stack([x, y])
+    end = np.column_stack([end_x, end_y])
+    tip_start = start + 0.8 * (end - start)
+    ax.add_collection(LineCollection(np.stack([start, end], axis=1), colors=color, alpha=alpha, linewidths=2,
+                                     capstyle='round', zorder=zorder))
+    ax.add_collection(LineCollection(np.stack([tip_start, end], axis=1), colors=color, alpha=alpha, linewidths=3.5,
+                                     capstyle='round', zorder=zorder))
+
 # %% Add custom tools to path
 
 root_folder = os.path.abspath(os.path.dirname(
@@ -43,6 +57,7 @@ sys.path.append(root_folder)
 import analysis_tools.whoscored_custom_events as wce
 import analysis_tools.whoscored_data_engineering as wde
 import analysis_tools.logos_and_badges as lab
+import analysis_tools.visuals as vis
 
 # %% User inputs
 
@@ -73,6 +88,7 @@ logo_brighten = True
 # %% League logo and league naming
 
 comp_logo = lab.get_competition_logo(league, year, logo_brighten)
+twitter_logo = np.asarray(Image.open('..\..\data_directory\misc_data\images\JK Twitter Logo.png').convert('RGBA'))
     
 # Create title and subtitles
 leagues = {'EPL': 'Premier League', 'La_Liga': 'La Liga', 'Bundesliga': 'Bundesliga', 'Serie_A': 'Serie A',
@@ -310,6 +326,10 @@ mpl.rcParams['xtick.color'] = 'w'
 mpl.rcParams['ytick.color'] = 'w'
 mpl.rcParams['text.color'] = 'w'
 
+# Shared text properties for per-player statistics
+stat_kw = dict(fontsize=8, color='w', zorder=3)
+stat_bold_kw = {**stat_kw, 'fontweight': 'bold'}
+
 # %% ------- VISUAL 1 - DIAMOND PLOT X VS Y METRIC -------
 
 # Plotting metrics
@@ -488,11 +508,10 @@ fig.text(0.5, 0.02, "Created by Jake Kolliari (@_JKDS_). Data provided by Opta."
 # Add twitter logo
 logo_ax = fig.add_axes([0.94, 0.005, 0.04, 0.04])
 logo_ax.axis("off")
-badge = Image.open('..\..\data_directory\misc_data\images\JK Twitter Logo.png')
-logo_ax.imshow(badge)
+logo_ax.imshow(twitter_logo)
 
 # Save image
-fig.savefig(f"player_effective_passers/{league}-{year}-diamond-{run_date.replace('/','_')}-{left_metric}-vs-{right_metric}-player-variant", dpi=300)
+fig.savefig(f"player_effective_passers/{league}-{year}-diamond-{run_date.replace('/','_')}-{left_metric}-vs-{right_metric}-player-variant.png", dpi=300, format="png", pil_kwargs={"compress_level": 1})
 
 # %% ------- VISUAL 2 - TOP 12 PROGRESSIVE PASSERS -------
 
@@ -520,13 +539,26 @@ else:
 pitch = Pitch(pitch_color='#313332', pitch_type='opta', line_color='white', linewidth=1, stripe=False)
 fig, ax = pitch.grid(nrows=3, ncols=4, grid_height=0.75, space=0.12, axis=False)
 fig.set_size_inches(14, 9)
+fig.set_layout_engine('none')
 fig.set_facecolor('#313332')
 ax['pitch'] = ax['pitch'].reshape(-1)
 
+# Normalised statistic label, label offset, column and rounding for each normalisation mode
+norm_spec = {'_90': ('/90 mins:', 24, 'suc_prog_passes_90', None),
+             '_100pass': ('/100 pass:', 26, 'suc_prog_passes_pct', 1),
+             '_100teampass': ('/100 team pass:', 38, 'suc_prog_passes_100teampass', 1)}.get(norm_mode)
+
+# Round displayed statistics once for the plotted players
+pp_top_df = pp_sorted_df.head(12)
+if norm_spec is not None:
+    norm_label, norm_xpos, norm_col, norm_round = norm_spec
+    if norm_round is not None:
+        pp_top_df = pp_top_df.assign(**{norm_col: pp_top_df[norm_col].round(norm_round)})
+
 # Plot successful prog passes as arrows, using for loop to iterate through each player and each pass
 idx = 0
 
-for player_id, name in pp_sorted_df.head(12).iterrows():
+for player_id, name in pp_top_df.iterrows():
     player_passes = suc_prog_passes[suc_prog_passes['playerId'] == player_id]
     player_assists = assists[assists['playerId'] == player_id]
     player_touch_assists = touch_assists[touch_assists['playerId'] == player_id]
@@ -534,29 +566,23 @@ for player_id, name in pp_sorted_df.head(12).iterrows():
 
     ax['pitch'][idx].set_title(f"  {idx + 1}: {name['name']}", loc = "left", color='w', fontsize = 10)
 
-    pitch.lines(player_passes['x'], player_passes['y'], player_passes['endX'], player_passes['endY'],
-                lw = 2, comet=True, capstyle='round', label = 'Progressive Pass', color = 'cyan', transparent=True, alpha = 0.1, zorder=1, ax=ax['pitch'][idx])
+    add_pass_lines(ax['pitch'][idx], player_passes['x'], player_passes['y'], player_passes['endX'], player_passes['endY'],
+                   color = 'cyan', alpha = 0.1, zorder=1)
   
-    pitch.lines(player_key_passes['x'], player_key_passes['y'], player_key_passes['endX'], player_key_passes['endY'],
-                lw = 2, comet=True, capstyle='round', label = 'Assists', color = 'lime', transparent=True, alpha = 0.5, zorder=2, ax=ax['pitch'][idx])
+    add_pass_lines(ax['pitch'][idx], player_key_passes['x'], player_key_passes['y'], player_key_passes['endX'], player_key_passes['endY'],
+                   color = 'lime', alpha = 0.5, zorder=2)
       
-    pitch.lines(player_assists['x'], player_assists['y'], player_assists['endX'], player_assists['endY'],
-            lw = 2, comet=True, capstyle='round', label = 'Assists', color = 'magenta', transparent=True, alpha = 0.5, zorder=3, ax=ax['pitch'][idx])
+    add_pass_lines(ax['pitch'][idx], player_assists['x'], player_assists['y'], player_assists['endX'], player_assists['endY'],
+                   color = 'magenta', alpha = 0.5, zorder=3)
 
     pitch.scatter(player_touch_assists['x'], player_touch_assists['y'], color = 'magenta', alpha = 0.8, s = 12, zorder=3, ax=ax['pitch'][idx])
 
-    ax['pitch'][idx].text(2, 4, "Total:", fontsize=8, fontweight='bold', color='w', zorder=3)
-    ax['pitch'][idx].text(15, 4, f"{int(name['suc_prog_passes'])}", fontsize=8, color='w', zorder=3)
+    ax['pitch'][idx].text(2, 4, "Total:", **stat_bold_kw)
+    ax['pitch'][idx].text(15, 4, f"{int(name['suc_prog_passes'])}", **stat_kw)
     
-    if norm_mode == '_90':
-        ax['pitch'][idx].text(2, 12, "/90 mins:", fontsize=8, fontweight='bold', color='w', zorder=3)
-        ax['pitch'][idx].text(24, 12, f"{name['suc_prog_passes_90']}", fontsize=8, color='w', zorder=3) 
-    elif norm_mode  == '_100pass':
-        ax['pitch'][idx].text(2, 12, "/100 pass:", fontsize=8, fontweight='bold', color='w', zorder=3)
-        ax['pitch'][idx].text(26, 12, f"{round(name['suc_prog_passes_pct'],1)}", fontsize=8, color='w', zorder=3)
-    elif norm_mode  == '_100teampass':
-        ax['pitch'][idx].text(2, 12, "/100 team pass:", fontsize=8, fontweight='bold', color='w', zorder=3)
-        ax['pitch'][idx].text(38, 12, f"{round(name['suc_prog_passes_100teampass'],1)}", fontsize=8, color='w', zorder=3)
+    if norm_spec is not None:
+        ax['pitch'][idx].text(2, 12, norm_label, **stat_bold_kw)
+        ax['pitch'][idx].text(norm_xpos, 12, f"{name[norm_col]}", **stat_kw)
     
     team = name['team']
     team_logo, _ = lab.get_team_badge_and_colour(team)
@@ -569,39 +595,17 @@ for player_id, name in pp_sorted_df.head(12).iterrows():
     
     idx += 1
 
-# Create title and subtitles, using highlighting as figure legend
+# Create titles, direction of play arrow, footer and logos, using highlighting as figure legend
 title_text = f"{leagues[league]} {year}/{int(year) + 1} - Top 12 {title_pos_str} by in-play progressive passes {title_addition}"
 subtitle_text = f"<Successful Progressive Passes>, <Key Progressive Passes> and <Assists>"
 subsubtitle_text = f"Correct as of {run_date}. {subsubtitle_addition}"
-fig.text(0.1, 0.945, title_text, fontweight="bold", fontsize=14.5, color='w')
-htext.fig_text(0.1, 0.93, s=subtitle_text, fontweight="regular", fontsize=13, color='w',
-               highlight_textprops=[{"color": 'cyan', "fontweight": 'bold'}, {"color": 'lime', "fontweight": 'bold'},
-                                    {"color": 'magenta', "fontweight": 'bold'}])
-fig.text(0.1, 0.8875, subsubtitle_text, fontweight="regular", fontsize=10, color='w')
-
-# Add direction of play arrow
-ax = fig.add_axes([0.042, 0.05, 0.18, 0.01])
-ax.axis("off")
-plt.arrow(0.51, 0.15, 0.1, 0, color="white")
-fig.text(0.13, 0.03, "Direction of play", ha="center", fontsize=10, color="white", fontweight="regular")
-
-# Add footer text
-fig.text(0.5, 0.04, "Created by Jake Kolliari (@_JKDS_). Data provided by Opta.",
-         fontstyle="italic", ha="center", fontsize=9, color="white")
-
-# Add competition logo
-ax = fig.add_axes([0.015, 0.877, 0.1, 0.1])
-ax.axis("off")
-ax.imshow(comp_logo)
-
-# Add twitter logo
-ax = fig.add_axes([0.92, 0.025, 0.04, 0.04])
-ax.axis("off")
-badge = Image.open('..\..\data_directory\misc_data\images\JK Twitter Logo.png')
-ax.imshow(badge)
+vis.add_chrome(fig, title_text, subtitle_text, subsubtitle_text,
+               [{"color": 'cyan', "fontweight": 'bold'}, {"color": 'lime', "fontweight": 'bold'},
+                {"color": 'magenta', "fontweight": 'bold'}],
+               comp_logo=comp_logo, twitter_logo=twitter_logo, title_fontsize=14.5)
 
 # Save image
-fig.savefig(f"player_effective_passers/{league}-{year}-top-progressive-passers-{run_date.replace('/','_')}{file_pos_str.replace(' & ','-').replace(' ','-')}-{title_addition.replace(' ','-')}", dpi=300)
+fig.savefig(f"player_effective_passers/{league}-{year}-top-progressive-passers-{run_date.replace('/','_')}{file_pos_str.replace(' & ','-').replace(' ','-')}-{title_addition.replace(' ','-')}.png", dpi=300, format="png", pil_kwargs={"compress_level": 1})
 
 
 # %% ------- VISUAL 3 - TOP 12 THREAT CREATORS -------
@@ -610,43 +614,47 @@ fig.savefig(f"player_effective_passers/{league}-{year}-top-progressive-passers-{
 pitch = Pitch(pitch_color='#313332', pitch_type='opta', line_color='white', linewidth=1, stripe=False)
 fig, ax = pitch.grid(nrows=3, ncols=4, grid_height=0.75, space=0.12, axis=False)
 fig.set_size_inches(14, 9)
+fig.set_layout_engine('none')
 fig.set_facecolor('#313332')
 ax['pitch'] = ax['pitch'].reshape(-1)
 
-# Manual implentation of colourmap
+# Manual implentation of colourmap, stored as a contiguous lookup table so colours can be gathered per player
 pass_cmap = cm.get_cmap('viridis')
-pass_cmap = pass_cmap(np.linspace(0.35,1,256))
+pass_cmap = np.ascontiguousarray(pass_cmap(np.linspace(0.35,1,256)), dtype=np.float32)
+low_threat_colour = mpl.colors.to_rgba('grey', 0.05)
+
+# Normalised statistic label, label offset, column and rounding for each normalisation mode
+norm_spec = {'_90': ('/90 mins:', 24, 'xThreat_gen_90', None),
+             '_100pass': ('/100 pass:', 26, 'xThreat_gen_100pass', 3),
+             '_100teampass': ('/100 team pass:', 38, 'xThreat_gen_100teampass', 3)}.get(norm_mode)
+
+# Round displayed statistics once for the plotted players
+xt_top_df = xt_sorted_df.head(12).assign(xThreat_gen_r2=xt_sorted_df.head(12)['xThreat_gen'].round(2))
+if norm_spec is not None:
+    norm_label, norm_xpos, norm_col, norm_round = norm_spec
+    if norm_round is not None:
+        xt_top_df = xt_top_df.assign(**{norm_col: xt_top_df[norm_col].round(norm_round)})
 
 # Plot successful prog passes as arrows, using for loop to iterate through each player and each pass
 idx = 0
 
-for player_id, name in xt_sorted_df.head(12).iterrows():
+for player_id, name in xt_top_df.iterrows():
     player_passes = suc_passes[suc_passes['playerId'] == player_id].sort_values('xThreat_gen', ascending = True)
     
     ax['pitch'][idx].set_title(f"  {idx + 1}: {name['name']}", loc = "left", color='w', fontsize = 10)
 
-    for _, pass_evt in player_passes.iterrows():
-        if pass_evt['xThreat_gen'] < 0.005:
-            line_colour = 'grey'
-            line_alpha = 0.05
-        else:
-            line_colour = pass_cmap[int(255*min(pass_evt['xThreat_gen']/0.05, 1))]
-            line_alpha = 0.7
-
-        pitch.lines(pass_evt['x'], pass_evt['y'], pass_evt['endX'], pass_evt['endY'],
-                    lw = 2, comet=True, capstyle='round', label = 'Pass', color = line_colour, transparent=True, alpha = line_alpha, zorder=1, ax=ax['pitch'][idx])
-
-    ax['pitch'][idx].text(2, 4, "Total:", fontsize=8, fontweight='bold', color='w', zorder=3)
-    ax['pitch'][idx].text(15, 4, f"{round(name['xThreat_gen'],2)}", fontsize=8, color='w', zorder=3)
-    if norm_mode == '_90':
-        ax['pitch'][idx].text(2, 12, "/90 mins:", fontsize=8, fontweight='bold', color='w', zorder=3)
-        ax['pitch'][idx].text(24, 12, f"{name['xThreat_gen_90']}", fontsize=8, color='w', zorder=3)        
-    if norm_mode  == '_100pass':
-        ax['pitch'][idx].text(2, 12, "/100 pass:", fontsize=8, fontweight='bold', color='w', zorder=3)
-        ax['pitch'][idx].text(26, 12, f"{round(name['xThreat_gen_100pass'],3)}", fontsize=8, color='w', zorder=3)
-    elif norm_mode  == '_100teampass':
-        ax['pitch'][idx].text(2, 12, "/100 team pass:", fontsize=8, fontweight='bold', color='w', zorder=3)
-        ax['pitch'][idx].text(38, 12, f"{round(name['xThreat_gen_100teampass'],3)}", fontsize=8, color='w', zorder=3)
+    x_arr, y_arr, ex, ey, xt_arr = (player_passes[c].to_numpy() for c in ('x', 'y', 'endX', 'endY', 'xThreat_gen'))
+    line_colours = pass_cmap[np.clip((xt_arr*(255.0/0.05)).astype(np.int32), 0, 255)]
+    line_colours[:, 3] = 0.7
+    line_colours[xt_arr < 0.005] = low_threat_colour
+
+    add_pass_lines(ax['pitch'][idx], x_arr, y_arr, ex, ey, color = line_colours, zorder=1)
+
+    ax['pitch'][idx].text(2, 4, "Total:", **stat_bold_kw)
+    ax['pitch'][idx].text(15, 4, f"{name['xThreat_gen_r2']}", **stat_kw)
+    if norm_spec is not None:
+        ax['pitch'][idx].text(2, 12, norm_label, **stat_bold_kw)
+        ax['pitch'][idx].text(norm_xpos, 12, f"{name[norm_col]}", **stat_kw)
     
     team = name['team']
     team_logo, _ = lab.get_team_badge_and_colour(team)
@@ -659,20 +667,13 @@ for player_id, name in xt_sorted_df.head(12).iterrows():
     
     idx += 1
     
-# Create title and subtitles, using highlighting as figure legend
+# Create titles, direction of play arrow, footer and logos, using highlighting as figure legend
 title_text = f"{leagues[league]} {year} - Top 12 {title_pos_str} by threat generated from in-play passes {title_addition}"
 subtitle_text = f"<Low Threat> and <High Threat> Successful Passes Shown"
 subsubtitle_text = f"Correct as of {run_date}. {subsubtitle_addition}"
-fig.text(0.1, 0.945, title_text, fontweight="bold", fontsize=16, color='w')
-htext.fig_text(0.1, 0.93, s=subtitle_text, fontweight="bold", fontsize=13, color='w',
-               highlight_textprops=[{"color": 'grey', "fontweight": 'bold'}, {"color": 'yellow', "fontweight": 'bold'}])
-fig.text(0.1, 0.8875, subsubtitle_text, fontweight="regular", fontsize=10, color='w')
-
-# Add direction of play arrow
-ax = fig.add_axes([0.042, 0.05, 0.18, 0.01])
-ax.axis("off")
-plt.arrow(0.51, 0.15, 0.1, 0, color="white")
-fig.text(0.13, 0.03, "Direction of play", ha="center", fontsize=10, color="white", fontweight="regular")
+vis.add_chrome(fig, title_text, subtitle_text, subsubtitle_text,
+               [{"color": 'grey', "fontweight": 'bold'}, {"color": 'yellow', "fontweight": 'bold'}],
+               comp_logo=comp_logo, twitter_logo=twitter_logo, subtitle_fontweight='bold', footer_x=0.75)
 
 # Add legend
 legend_ax = fig.add_axes([0.275, 0.023, 0.2, 0.06])
@@ -705,20 +706,5 @@ for idx in np.arange(0,hex_count):
     legend_ax.text(xpos+0.03, ypos-0.02, xt, color='w', fontsize = 8, ha = "center", va = "center", path_effects = path_eff)
     legend_ax.text(0.1, 0.5, "xThreat:", color='w', fontsize = 10, ha = "left", va = "center", fontweight="regular")
 
-# Add footer text
-fig.text(0.75, 0.04, "Created by Jake Kolliari (@_JKDS_). Data provided by Opta.",
-         fontstyle="italic", ha="center", fontsize=9, color="white")
-
-# Add competition logo
-ax = fig.add_axes([0.015, 0.877, 0.1, 0.1])
-ax.axis("off")
-ax.imshow(comp_logo)
-
-# Add twitter logo
-ax = fig.add_axes([0.92, 0.025, 0.04, 0.04])
-ax.axis("off")
-badge = Image.open('..\..\data_directory\misc_data\images\JK Twitter Logo.png')
-ax.imshow(badge)
-
 # Save image
-fig.savefig(f"player_effective_passers/{league}-{year}-top-threat-generators-{run_date.replace('/','_')}{file_pos_str.replace(' & ','-').replace(' ','-')}-{title_addition.replace(' ','-')}", dpi=300)
\ No newline at end of file
+fig.savefig(f"player_effective_passers/{league}-{year}-top-threat-generators-{run_date.replace('/','_')}{file_pos_str.replace(' & ','-').replace(' ','-')}-{title_addition.replace(' ','-')}.png", dpi=300, format="png", pil_kwargs={"compress_level": 1})
\ No newline at end of file
@@ -16,8 +16,9 @@
 # %% Imports and parameters
 
 import pandas as pd
-import matplotlib.pyplot as plt
 import matplotlib as mpl
+mpl.use('Agg')
+import matplotlib.pyplot as plt
 from matplotlib.transforms import Affine2D
 from matplotlib.ticker import MultipleLocator
 import mpl_toolkits.axisartist.floating_axes as floating_axes
@@ -25,12 +26,11 @@ from mpl_toolkits.axisartist.grid_finder import (FixedLocator, MaxNLocator, Dict
 import matplotlib.patheffects as path_effects
 import matplotlib.cm as cm
 from PIL import Image, ImageEnhance
-import adjustText
 import os
 import sys
 import bz2
-import pickle
 import numpy as np
+from scipy.stats import gaussian_kde
 import highlight_text as htext
 import glob
 from mplsoccer.pitch import Pitch, VerticalPitch
@@ -38,6 +38,49 @@ from mplsoccer import add_image
 from matplotlib.colors import ListedColormap
 from matplotlib.offsetbox import OffsetImage, AnnotationBbox
 
+# %% Function definitions
+
+
+def place_labels(ax, texts, n_cells=20, extent=(0, 1, 0, 1)):
+    """ Place labels in a single greedy pass over a coarse occupancy grid. Each label keeps its own cell if free,
+    otherwise moves to the first free neighbouring cell with a leader line back to its original position."""
+    occupied = np.zeros((n_cells, n_cells), dtype=bool)
+    cell_w = (extent[1] - extent[0]) / n_cells
+    cell_h = (extent[3] - extent[2]) / n_cells
+    offsets = [(0, 0), (0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (-1, 1), (1, -1), (-1, -1)]
+    for text in texts:
+        x, y = text.get_position()
+        cell_x = int(np.clip((x - extent[0]) // cell_w, 0, n_cells - 1))
+        cell_y = int(np.clip((y - extent[2]) // cell_h, 0, n_cells - 1))
+        for dx, dy in offsets:
+            new_cell_x, new_cell_y = cell_x + dx, cell_y + dy
+            if 0 <= new_cell_x < n_cells and 0 <= new_cell_y < n_cells and not occupied[new_cell_x, new_cell_y]:
+                occupied[new_cell_x, new_cell_y] = True
+                if (dx, dy) != (0, 0):
+                    new_x, new_y = x + dx * cell_w, y + dy * cell_h
+                    text.set_position((new_x, new_y))
+                    ax.plot([x, new_x], [y, new_y], color='w', lw=0.5, alpha=0.5, zorder=2)
+                break
+
+
+def build_match_data(file_path, files):
+    """ Load event and player data from match files, storing low cardinality event descriptors as categoricals so
+    equality filters compare integer codes, and tag in-play successful box entries and progressive actions."""
+    match_data = list(zip(files, wde.load_files(file_path, files)))
+
+    # Build dataframes with a single concatenation each
+    events_df = pd.concat([data for file, data in match_data if '-eventdata-' in file])
+    players_df = pd.concat([data for file, data in match_data if '-playerdata-' in file])
+
+    for col in ['eventType', 'outcomeType']:
+        events_df[col] = events_df[col].astype('category')
+
+    # Tag in-play successful box entries and progressive actions
+    events_df['progressive'] = wce.progressive_action_vec(events_df, inplay = True, successful_only = True)
+    events_df['box_entry'] = wce.box_entry_vec(events_df, inplay = True, successful_only = True)
+
+    return events_df, players_df
+
 # %% Add custom tools to path
 
 root_folder = os.path.abspath(os.path.dirname(
@@ -45,6 +88,7 @@ root_folder = os.path.abspath(os.path.dirname(
 sys.path.append(root_folder)
 
 import analysis_tools.whoscored_custom_events as wce
+import analysis_tools.pitch_zones as pz
 import analysis_tools.whoscored_data_engineering as wde
 import analysis_tools.logos_and_badges as lab
 
@@ -81,6 +125,9 @@ grid_density = 'sparse'
 # %% League logo and league naming
 
 comp_logo = lab.get_competition_logo(league, year, logo_brighten)
+twitter_logo = Image.open('..\..\data_directory\misc_data\images\JK Twitter Logo.png')
+pass_logo = Image.open('..\..\data_directory\misc_data\images\PassLogo.png')
+carry_logo = Image.open('..\..\data_directory\misc_data\images\CarryLogo.png')
     
 # Create title and subtitles
 leagues = {'EPL': 'Premier League', 'La_Liga': 'La Liga', 'Bundesliga': 'Bundesliga', 'Serie_A': 'Serie A',
@@ -90,35 +137,10 @@ leagues = {'EPL': 'Premier League', 'La_Liga': 'La Liga', 'Bundesliga': 'Bundesl
 # %% Get data
 
 file_path = f"../../data_directory/whoscored_data/{year}_{str(int(year.replace('20','')) + 1)}/{league}"
-files = os.listdir(file_path)
-
-# Initialise storage dataframes
-events_df = pd.DataFrame()
-players_df = pd.DataFrame()
-
-# Load data
-for file in files:
-    if file == 'event-types.pbz2':
-        event_types = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        event_types = pickle.load(event_types)
-    elif file == 'formation-mapping.pbz2':
-        formation_mapping = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        formation_mapping = pickle.load(formation_mapping)
-    elif '-eventdata-' in file:
-        match_events = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        match_events = pickle.load(match_events)
-        events_df = pd.concat([events_df, match_events])
-    elif '-playerdata-' in file:
-        match_players = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        match_players = pickle.load(match_players)
-        players_df = pd.concat([players_df, match_players])
-    else:
-        pass
-
-# %% Tag in-play successful box entries and progressive acions
+files = [file for file in os.listdir(file_path) if file.endswith('.pbz2')]
 
-events_df['progressive'] = events_df.apply(wce.progressive_action, axis=1, inplay = True, successful_only = True)
-events_df['box_entry'] = events_df.apply(wce.box_entry, axis=1, inplay = True, successful_only = True)
+# Read loaded and tagged data from cache if source files and processing are unchanged since last run
+events_df, players_df = wde.load_cached_data(file_path, files, 'threat-creators', build_match_data)
 
 # %% Create player dataframe and account for players that have played for multiple teams
 
@@ -136,21 +158,28 @@ playerinfo_df = playerinfo_df.drop('mins_played', axis=1).join(playerinfo_mp)
 
 # %% Aggregate data per player
 
+# Event masks, computed once and shared by each aggregation
+carry_mask = (events_df['eventType'] == 'Carry').to_numpy()
+pass_mask = ((events_df['eventType'] == 'Pass').to_numpy() &
+             events_df['satisfiedEventsTypes'].map(frozenset([31, 32, 33, 34, 212]).isdisjoint).to_numpy(dtype=bool))
+box_entry_mask = events_df['box_entry'].to_numpy(dtype=bool)
+progressive_mask = events_df['progressive'].to_numpy(dtype=bool)
+
 # Carries and total xT
-all_carries = events_df[events_df['eventType']=='Carry']
+all_carries = events_df[carry_mask]
 playerinfo_df = wde.group_player_events(all_carries, playerinfo_df, col_names='carries')
 playerinfo_df = wde.group_player_events(all_carries, playerinfo_df, group_type='sum', agg_columns = ['xThreat', 'xThreat_gen'], col_names=['xThreat_carry', 'xThreat_gen_carry'])
 
 # Passes and total xT
-all_passes = events_df[(events_df['eventType']=='Pass') & (~events_df['satisfiedEventsTypes'].apply(lambda x: 31 in x or 32 in x or 33 in x or 34 in x or 212 in x))]
+all_passes = events_df[pass_mask]
 playerinfo_df = wde.group_player_events(all_passes, playerinfo_df, col_names='passes')
 playerinfo_df = wde.group_player_events(all_passes, playerinfo_df, group_type='sum', agg_columns = ['xThreat', 'xThreat_gen'], col_names=['xThreat_pass', 'xThreat_gen_pass'])
 
 # Box entries and progresive actions
-playerinfo_df = wde.group_player_events(all_passes[all_passes['box_entry']==True], playerinfo_df, col_names='pass_into_box')
-playerinfo_df = wde.group_player_events(all_carries[all_carries['box_entry']==True], playerinfo_df, col_names='carry_into_box')
-playerinfo_df = wde.group_player_events(all_passes[all_passes['progressive']==True], playerinfo_df, col_names='progressive_pass')
-playerinfo_df = wde.group_player_events(all_carries[all_carries['progressive']==True], playerinfo_df, col_names='progressive_carry')
+playerinfo_df = wde.group_player_events(events_df[pass_mask & box_entry_mask], playerinfo_df, col_names='pass_into_box')
+playerinfo_df = wde.group_player_events(events_df[carry_mask & box_entry_mask], playerinfo_df, col_names='carry_into_box')
+playerinfo_df = wde.group_player_events(events_df[pass_mask & progressive_mask], playerinfo_df, col_names='progressive_pass')
+playerinfo_df = wde.group_player_events(events_df[carry_mask & progressive_mask], playerinfo_df, col_names='progressive_carry')
 
 # Aggregate carries
 playerinfo_df['carries_90'] = round(90*playerinfo_df['carries']/playerinfo_df['mins_played'],2)
@@ -171,32 +200,74 @@ playerinfo_df['box_actions'] = playerinfo_df['pass_into_box'] + playerinfo_df['c
 playerinfo_df['box_actions_90'] = playerinfo_df['box_passes_90'] + playerinfo_df['box_carries_90']
 playerinfo_df['prog_actions_90'] = playerinfo_df['prog_passes_90'] + playerinfo_df['prog_carries_90']
 
+# Downcast aggregated columns ahead of sorting and quantile calculations
+count_cols = ['carries', 'passes', 'pass_into_box', 'carry_into_box', 'progressive_pass', 'progressive_carry',
+              'box_actions']
+per90_cols = ['carries_90', 'xThreat_carry_90', 'xThreat_gen_carry_90', 'box_carries_90', 'prog_carries_90',
+              'passes_90', 'xThreat_pass_90', 'xThreat_gen_pass_90', 'box_passes_90', 'prog_passes_90',
+              'box_actions_90', 'prog_actions_90']
+playerinfo_df[count_cols] = playerinfo_df[count_cols].astype(np.int32)
+playerinfo_df[per90_cols] = playerinfo_df[per90_cols].astype(np.float32)
+
 # Threat creating events
 all_threat_events = pd.concat([all_carries, all_passes], axis = 0)
 
-# %% Calculate player threat creation per zone
-
-pitch = VerticalPitch(pitch_color='#313332', pitch_type='opta', line_color='white', linewidth=1, stripe=False)
-
-for player_id, player_details in playerinfo_df.iterrows():
-    player_events = all_threat_events[all_threat_events['playerId']==player_id]
-    bin_statistic = pitch.bin_statistic(player_events['x'], player_events['y'],
-                                        statistic='sum', bins=(12, 10) if grid_density == 'dense' else (6, 5) , normalize=False, values = player_events['xThreat_gen'])
-    if player_details['mins_played'] != 0:
-        bin_statistic['statistic'] = 90*bin_statistic['statistic'] / player_details['mins_played']
-    else:
-        bin_statistic['statistic'] = np.zeros(bin_statistic['statistic'].shape)
-    for idx, zone_threat in enumerate(bin_statistic['statistic'].reshape(-1, order = 'F')):
-        playerinfo_df.loc[player_id, f'zone_{idx}_xT' ] = zone_threat
-
 # %% Filter playerinfo
 
 playerinfo_df = playerinfo_df[(playerinfo_df['mins_played']>=min_mins) & (~playerinfo_df['pos_type'].isin(pos_exclude))]
 playerinfo_df = playerinfo_df[~playerinfo_df.index.duplicated(keep='first')]
 
+# %% Calculate player threat creation per zone
+
+pitch = VerticalPitch(pitch_color='#313332', pitch_type='opta', line_color='white', linewidth=1, stripe=False)
+zone_bins = (12, 10) if grid_density == 'dense' else (6, 5)
+n_zones = zone_bins[0] * zone_bins[1]
+
+# Zone grid, computed once and used to bin events and to draw and label pitch zones
+bin_statistic = pitch.bin_statistic([0], [0], statistic='sum', bins=zone_bins, normalize=False, values=[0])
+xedges, yedges, flip_rows = pz.zone_grid_edges(bin_statistic)
+
+# Bin each threat creating event, numbering zones column-major to match the zone grid (rows flipped to the grid order)
+threat_x = all_threat_events['x'].to_numpy()
+threat_y = all_threat_events['y'].to_numpy()
+zone_x = np.clip(np.digitize(threat_x, xedges) - 1, 0, zone_bins[0] - 1)
+zone_y = np.clip(np.digitize(threat_y, yedges) - 1, 0, zone_bins[1] - 1)
+if flip_rows:
+    zone_y = zone_bins[1] - 1 - zone_y
+player_row = playerinfo_df.index.get_indexer(all_threat_events['playerId'])
+valid = ((player_row >= 0) & (threat_x >= xedges[0]) & (threat_x <= xedges[-1]) &
+         (threat_y >= yedges[0]) & (threat_y <= yedges[-1]))
+
+# Sum threat per player and zone in a single pass, then normalise per 90 mins
+zone_xt = np.bincount(player_row[valid] * n_zones + (zone_x * zone_bins[1] + zone_y)[valid],
+                      weights=all_threat_events['xThreat_gen'].to_numpy()[valid],
+                      minlength=len(playerinfo_df) * n_zones).reshape(len(playerinfo_df), n_zones)
+mins_played = playerinfo_df['mins_played'].to_numpy()[:, np.newaxis]
+zone_xt_90 = np.zeros((len(playerinfo_df), n_zones), dtype=np.float32)
+np.divide(90*zone_xt, mins_played, out=zone_xt_90, where=mins_played != 0, casting='same_kind')
+
+# Add all zone columns to player information as a single block
+zone_cols = [f'zone_{idx}_xT' for idx in np.arange(n_zones)]
+zone_df = pd.DataFrame(zone_xt_90, index=playerinfo_df.index, columns=zone_cols)
+playerinfo_df = playerinfo_df.join(zone_df)
+
+# %% Format player names
+
+name_parts = playerinfo_df['name'].str.split(' ')
+multi_part_name = name_parts.str.len() > 1
+first_initial = name_parts.str[0].str[0]
+last_name = name_parts.str[-1]
+playerinfo_df['format_name'] = np.where(multi_part_name, first_initial + ' ' + last_name, playerinfo_df['name'])
+playerinfo_df['format_name_dot'] = np.where(multi_part_name, first_initial + '. ' + last_name, playerinfo_df['name'])
+
+# %% Load team badges
+
+badge_cache = {team: lab.get_team_badge_and_colour(team)[0] for team in playerinfo_df['team'].unique()}
+
 # %% Plot formatting
 
 # Overwrite rcparams
+mpl.rcParams['figure.autolayout'] = False
 mpl.rcParams['xtick.color'] = 'w'
 mpl.rcParams['ytick.color'] = 'w'
 mpl.rcParams['text.color'] = 'w'
@@ -212,14 +283,21 @@ right_ax_plot = playerinfo_df[right_metric]
 left_ax_plot.replace(np.nan, 0, inplace=True)
 right_ax_plot.replace(np.nan, 0, inplace=True)
 
-left_ax_norm_plot = 0.99 * left_ax_plot / max(left_ax_plot)
-right_ax_norm_plot = 0.99 * right_ax_plot / max(right_ax_plot)
+# Compute all quantiles in one pass per metric, with the maximum as the 1.0 quantile
+left_qs = left_ax_plot.quantile([0, 0.2, 0.5, 0.8, 0.9, 1.0]).to_numpy()
+right_qs = right_ax_plot.quantile([0, 0.2, 0.5, 0.8, 0.9, 1.0]).to_numpy()
+left_max, right_max = left_qs[-1], right_qs[-1]
+
+left_ax_norm_plot = 0.99 * left_ax_plot / left_max
+right_ax_norm_plot = 0.99 * right_ax_plot / right_max
+left_qs_norm = 0.99 * left_qs / left_max
+right_qs_norm = 0.99 * right_qs / right_max
 
-left_ax_quantile = left_ax_norm_plot.quantile([0.2,0.5,0.8]).tolist()
-right_ax_quantile = right_ax_norm_plot.quantile([0.2,0.5,0.8]).tolist()
+left_ax_quantile = left_qs_norm[[1,2,3]].tolist()
+right_ax_quantile = right_qs_norm[[1,2,3]].tolist()
 
-plot_quantile_left = left_ax_norm_plot.quantile([0,0.5,0.9]).tolist()
-plot_quantile_right = right_ax_norm_plot.quantile([0,0.5,0.9]).tolist()
+plot_quantile_left = left_qs_norm[[0,2,4]].tolist()
+plot_quantile_right = right_qs_norm[[0,2,4]].tolist()
 plot_player = playerinfo_df[(left_ax_norm_plot>plot_quantile_left[2]) | (right_ax_norm_plot>plot_quantile_right[2])]
 
 #plot_player = playerinfo_df[playerinfo_df['team']=='Man Utd']
@@ -242,8 +320,8 @@ for i in ticks:
         left_dict[i] = ''
         right_dict[i] =  ''
     else:
-        left_dict[i] = str(round((i * left_ax_plot.max())/0.99,3))
-        right_dict[i] = str(round((i * right_ax_plot.max())/0.99,3))
+        left_dict[i] = str(round((i * left_max)/0.99,3))
+        right_dict[i] = str(round((i * right_max)/0.99,3))
     
 tick_formatter1 = DictFormatter(right_dict)
 tick_formatter2 = DictFormatter(left_dict)
@@ -300,15 +378,18 @@ z_ax1.text(0.5, 0.5, 0, ha = "center", va = "center")
 ax.grid(alpha=0.2, color ='w')
 
 # Plot points on auxilary axis
-aux_ax.scatter(right_ax_norm_plot, left_ax_norm_plot, c = left_ax_norm_plot+right_ax_norm_plot, cmap = 'viridis', edgecolor = 'w', s = 50, lw = 0.3, zorder=2)
+point_x = right_ax_norm_plot.to_numpy()
+point_y = left_ax_norm_plot.to_numpy()
+point_vals = point_x + point_y
+point_colours = cm.viridis(mpl.colors.Normalize(vmin=point_vals.min(), vmax=point_vals.max())(point_vals))
+aux_ax.scatter(point_x, point_y, c = point_colours, edgecolor = 'w', s = 50, lw = 0.3, zorder=2, rasterized=True)
 
 # Add text
 text = list()
 path_eff = [path_effects.Stroke(linewidth=1.5, foreground='#313332'), path_effects.Normal()]
 for i, player in plot_player.iterrows():
-    format_name =  player['name'].split(' ')[0][0] + " " + player['name'].split(' ')[len(player['name'].split(' '))-1] if len(player['name'].split(' '))>1 else player['name']
-    text.append(aux_ax.text(right_ax_norm_plot[i]+0.01, left_ax_norm_plot[i], format_name, color='w', fontsize=7, zorder=3, path_effects = path_eff))
-adjustText.adjust_text(text, ax = ax)
+    text.append(aux_ax.text(right_ax_norm_plot[i]+0.01, left_ax_norm_plot[i], player['format_name'], color='w', fontsize=7, zorder=3, path_effects = path_eff))
+place_labels(aux_ax, text)
 
 # Add axis shading
 aux_ax.fill([right_ax_quantile[0], right_ax_quantile[0], right_ax_quantile[2], right_ax_quantile[2]], [0, 100, 100, 0], color='grey', alpha = 0.15, zorder=0)
@@ -334,8 +415,7 @@ text_ax_left.set_xlim([0,1])
 text_ax_left.set_ylim([0,1])
 
 logo_ax_left = fig.add_axes([0.19,0.73,0.1,0.1])
-box_logo = Image.open('..\..\data_directory\misc_data\images\PassLogo.png')
-logo_ax_left.imshow(box_logo)
+logo_ax_left.imshow(pass_logo)
 logo_ax_left.axis("off")
 logo_ax_left.set_aspect(0.55)
 
@@ -349,8 +429,7 @@ text_ax_right.set_xlim([0,1])
 text_ax_right.set_ylim([0,1])
 
 logo_ax_right = fig.add_axes([0.72,0.73,0.1,0.1])
-tackle_logo = Image.open('..\..\data_directory\misc_data\images\CarryLogo.png')
-logo_ax_right.imshow(tackle_logo)
+logo_ax_right.imshow(carry_logo)
 logo_ax_right.axis("off")
 
 # Add bottom text axis
@@ -380,11 +459,11 @@ fig.text(0.5, 0.02, "Created by Jake Kolliari (@_JKDS_). Data provided by Opta."
 # Add twitter logo
 logo_ax = fig.add_axes([0.94, 0.005, 0.04, 0.04])
 logo_ax.axis("off")
-badge = Image.open('..\..\data_directory\misc_data\images\JK Twitter Logo.png')
-logo_ax.imshow(badge)
+logo_ax.imshow(twitter_logo)
 
 # Save image
-fig.savefig(f"player_threat_creators/{league}-{year}-diamond-{run_date.replace('/','_')}-{left_metric}-vs-{right_metric}-player-variant", dpi=300)
+fig.savefig(f"player_threat_creators/{league}-{year}-diamond-{run_date.replace('/','_')}-{left_metric}-vs-{right_metric}-player-variant.png", dpi=300, format="png", pil_kwargs={"compress_level": 1})
+plt.close(fig)
 
 # %% ------- VISUAL 2 - TOP THREAT CREATORS BY ZONE -------
 
@@ -401,16 +480,26 @@ xs = bin_statistic['cx'].reshape(-1, order = 'F')
 ys = bin_statistic['cy'].reshape(-1, order = 'F')
 path_eff = [path_effects.Stroke(linewidth=2, foreground='#313332'), path_effects.Normal()]
 
-for idx in np.arange(0, len(bin_statistic['statistic'].reshape(-1))):
-    playerinfo_df.sort_values(by = f'zone_{idx}_xT', ascending = False, inplace = True)
+# Shorten long names to fit within pitch zones
+zone_name = playerinfo_df['format_name_dot']
+if pitch_mode == '3' and grid_density != 'dense':
+    playerinfo_df['zone_name'] = zone_name.where(zone_name.str.len() <= 13, zone_name.str[0:11] + '...')
+else:
+    playerinfo_df['zone_name'] = zone_name.where(zone_name.str.len() <= 14, zone_name.str[0:14] + '\n' + zone_name.str[14:])
+
+# Find the top players in every zone at once, ordered by descending zone threat
+zone_matrix = playerinfo_df[zone_cols].to_numpy()
+n_top = 3 if pitch_mode == '3' and grid_density != 'dense' else 1
+top_rows = np.argpartition(-zone_matrix, n_top - 1, axis=0)[:n_top]
+top_rows = np.take_along_axis(top_rows, np.argsort(-np.take_along_axis(zone_matrix, top_rows, axis=0), axis=0), axis=0)
+
+for idx in np.arange(0, n_zones):
     if pitch_mode == '3' and grid_density != 'dense':
         cnt = 0
-        for p_id, p_info in playerinfo_df.head(3).iterrows():
-            player_name = p_info['name']
-            format_name = player_name.split(' ')[0][0] + ". " + player_name.split(' ')[len(player_name.split(' '))-1] if len(player_name.split(' '))>1 else player_name
-            format_name = format_name if len(format_name) <= 13 else format_name[0:11] + '...'
-            format_text = format_name + '\n' + 'xT: ' +str(round(p_info[f'zone_{idx}_xT'],3))
-            team_logo, _ = lab.get_team_badge_and_colour(p_info['team'])
+        for row in top_rows[:, idx]:
+            p_info = playerinfo_df.iloc[row]
+            format_text = p_info['zone_name'] + '\n' + 'xT: ' +str(round(p_info[f'zone_{idx}_xT'],3))
+            team_logo = badge_cache[p_info['team']]
             ab = AnnotationBbox(OffsetImage(team_logo, zoom = 0.05, resample = True), (ys[idx]+6.75, xs[idx]+5-cnt), frameon=False)
             ax['pitch'].add_artist(ab)
             pitch.annotate(text = format_text, xy = (xs[idx]+5-cnt, ys[idx]+3.5), ha = "left", va = "center", ax=ax['pitch'], fontsize = 6, path_effects=path_eff)
@@ -418,11 +507,9 @@ for idx in np.arange(0, len(bin_statistic['statistic'].reshape(-1))):
         title_plural = 's'
         file_ext = 'top3'
     else:
-        player_name = playerinfo_df.head(1)['name'].values[0]
-        format_name = player_name.split(' ')[0][0] + ". " + player_name.split(' ')[len(player_name.split(' '))-1] if len(player_name.split(' '))>1 else player_name
-        format_name = format_name if len(format_name) <= 14 else format_name[0:14] + '\n' + format_name[14:]
-        format_text = format_name + '\n' + 'xT: ' +str(round(playerinfo_df.head(1)[f'zone_{idx}_xT'].values[0],3))
-        team_logo, _ = lab.get_team_badge_and_colour(playerinfo_df.head(1)['team'].values[0])
+        p_info = playerinfo_df.iloc[top_rows[0, idx]]
+        format_text = p_info['zone_name'] + '\n' + 'xT: ' +str(round(p_info[f'zone_{idx}_xT'],3))
+        team_logo = badge_cache[p_info['team']]
         title_plural = ''
         if grid_density == 'dense':
             ab = AnnotationBbox(OffsetImage(team_logo, zoom = 0.05, resample = True), (ys[idx], xs[idx]+2), frameon=False)
@@ -460,17 +547,24 @@ fig.text(0.5, 0.025, "Created by Jake Kolliari (@_JKDS_). Data provided by Opta.
 # Add twitter logo
 logo_ax = fig.add_axes([0.91, -0.005, 0.07, 0.07])
 logo_ax.axis("off")
-badge = Image.open('..\..\data_directory\misc_data\images\JK Twitter Logo.png')
-logo_ax.imshow(badge)
+logo_ax.imshow(twitter_logo)
 
 # Save image
-fig.savefig(f"player_threat_creators/{league}-{year}-top_threat_creator_by_zone-{file_ext}-{run_date.replace('/','_')}", dpi=300)
+fig.savefig(f"player_threat_creators/{league}-{year}-top_threat_creator_by_zone-{file_ext}-{run_date.replace('/','_')}.png", dpi=300, format="png", pil_kwargs={"compress_level": 1})
+plt.close(fig)
 
 # %% ------- VISUAL 3 - TOP 20 BOX ENTRIES -------
 
 # Order dataframe
 be_sorted_df = playerinfo_df.sort_values('box_actions_90', ascending=False)
 
+# Index box entries by player once, so each player's entries are a contiguous slice
+box_entries_by_player = events_df.loc[events_df['box_entry']==True, ['playerId', 'x', 'y']].set_index('playerId').sort_index()
+
+# Set up a single grid on which every player's box entry density is evaluated
+kde_x, kde_y = np.mgrid[0:100:120j, 0:100:120j]
+kde_grid = np.vstack([kde_x.ravel(), kde_y.ravel()])
+
 # Define custom colourmap
 CustomCmap = mpl.colors.LinearSegmentedColormap.from_list("", ["#313332","#47516B", "#848178", "#B2A66F", "#FDE636"])
 
@@ -486,19 +580,23 @@ idx = 0
 for player_id, name in be_sorted_df.head(20).iterrows():
     
     # Get box entries
-    player_box_entries = events_df[(events_df['box_entry']==True) & (events_df['playerId'] == player_id)]
+    player_box_entries = box_entries_by_player.loc[player_id:player_id]
     
-    # Format and print player name
-    format_name =  name['name'].split(' ')[0][0] + " " + name['name'].split(' ')[len(name['name'].split(' '))-1] if len(name['name'].split(' '))>1 else name['name']
-    ax['pitch'][idx].set_title(f"  {idx + 1}: {format_name}", loc = "left", color='w', fontsize = 10, pad=-2)
-
-    # Plot density of start positions of box entries
-    kde_plot = pitch.kdeplot(player_box_entries['x'], player_box_entries['y'], ax=ax['pitch'][idx],
-                              fill=True, levels=100, shade_lowest=True,
-                              cut=4, cmap=CustomCmap, zorder=0)
+    # Print player name
+    ax['pitch'][idx].set_title(f"  {idx + 1}: {name['format_name']}", loc = "left", color='w', fontsize = 10, pad=-2)
+
+    # Plot density of start positions of box entries (skipped if start positions are collinear or identical)
+    if len(player_box_entries) > 2:
+        try:
+            kde = gaussian_kde(np.vstack([player_box_entries['x'], player_box_entries['y']]), bw_method='scott')
+        except np.linalg.LinAlgError:
+            pass
+        else:
+            kde_z = kde(kde_grid).reshape(kde_x.shape)
+            ax['pitch'][idx].contourf(kde_y, kde_x, kde_z, levels=100, cmap=CustomCmap, zorder=0, rasterized=True)
     
     # Scatter starting points
-    pitch.scatter(player_box_entries['x'], player_box_entries['y'], color = 'w', alpha = 0.4, s = 12, zorder=1, ax=ax['pitch'][idx])
+    pitch.scatter(player_box_entries['x'], player_box_entries['y'], color = 'w', alpha = 0.4, s = 12, zorder=1, rasterized=True, ax=ax['pitch'][idx])
     
     # Plot polygon within penalty box
     ax['pitch'][idx].fill([21.1, 78.9, 78.9, 21.1], [83, 83, 100, 100], '#313332', alpha = 1, zorder=0)
@@ -510,8 +608,7 @@ for player_id, name in be_sorted_df.head(20).iterrows():
         ax['pitch'][idx].text(4, 58, "/90 mins:", fontsize=8, fontweight='bold', color='w', zorder=3, ha = 'right')
         ax['pitch'][idx].text(4, 53, f"{round(name['box_actions_90'],2)}", fontsize=8, color='w', zorder=3, ha = 'right')        
     
-    team = name['team']
-    team_logo, _ = lab.get_team_badge_and_colour(team)
+    team_logo = badge_cache[name['team']]
             
     ax_pos = ax['pitch'][idx].get_position()
     
@@ -548,7 +645,7 @@ ax.imshow(comp_logo)
 # Add twitter logo
 ax = fig.add_axes([0.94, 0.007, 0.03, 0.03])
 ax.axis("off")
-badge = Image.open('..\..\data_directory\misc_data\images\JK Twitter Logo.png')
-ax.imshow(badge)    
+ax.imshow(twitter_logo)    
 
-fig.savefig(f"player_threat_creators/{league}-{year}-player-box-entries", dpi=300)
+fig.savefig(f"player_threat_creators/{league}-{year}-player-box-entries.png", dpi=300, format="png", pil_kwargs={"compress_level": 1})
+plt.close(fig)
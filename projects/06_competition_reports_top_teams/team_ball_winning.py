@@ -11,20 +11,35 @@
 # %% Imports and parameters
 
 import pandas as pd
-import matplotlib.pyplot as plt
 import matplotlib as mpl
+mpl.use('Agg')
+import matplotlib.pyplot as plt
 from PIL import Image, ImageEnhance
 from mplsoccer.pitch import VerticalPitch, Pitch
 import matplotlib.patheffects as path_effects
 import os
 import sys
-import bz2
-import pickle
 import numpy as np
 from collections import Counter
 import highlight_text as htext
 import glob
 
+# %% Function definitions
+
+def build_match_data(file_path, files):
+    """ Load event and player data from match files, downcasting coordinates to float32 and storing low cardinality
+    descriptors as categoricals so equality and isin filters compare integer codes."""
+    match_data = list(zip(files, wde.load_files(file_path, files)))
+
+    # Build dataframes with a single concatenation each
+    events_df = pd.concat([data for file, data in match_data if '-eventdata-' in file])
+    players_df = pd.concat([data for file, data in match_data if '-playerdata-' in file])
+
+    events_df = events_df.astype({'x': 'float32', 'y': 'float32', 'eventType': 'category', 'outcomeType': 'category'})
+    players_df = players_df.astype({'team': 'category'})
+
+    return events_df, players_df
+
 # %% Add custom tools to path
 
 root_folder = os.path.abspath(os.path.dirname(
@@ -63,59 +78,43 @@ comp_logo = lab.get_competition_logo(league, year, logo_brighten=logo_brighten)
 # %% Get data
 
 file_path = f"../../data_directory/whoscored_data/{year}_{str(int(year.replace('20','')) + 1)}/{league}"
-files = os.listdir(file_path)
-
-# Initialise storage dataframes
-events_df = pd.DataFrame()
-players_df = pd.DataFrame()
-
-# Load data
-for file in files:
-    if file == 'event-types.pbz2':
-        event_types = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        event_types = pickle.load(event_types)
-    elif file == 'formation-mapping.pbz2':
-        formation_mapping = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        formation_mapping = pickle.load(formation_mapping)
-    elif '-eventdata-' in file:
-        match_events = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        match_events = pickle.load(match_events)
-        events_df = pd.concat([events_df, match_events])
-    elif '-playerdata-' in file:
-        match_players = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        match_players = pickle.load(match_players)
-        players_df = pd.concat([players_df, match_players])
-    else:
-        pass
+event_files = [os.path.basename(file) for file in glob.glob(f"{file_path}/*-eventdata-*.pbz2")]
+player_files = [os.path.basename(file) for file in glob.glob(f"{file_path}/*-playerdata-*.pbz2")]
+files = event_files + player_files
 
-# %% Isolate ball wins
+# Read loaded data from cache if source files and processing are unchanged since last run, keeping only the event
+# and player columns used in this analysis
+events_df, players_df = wde.load_cached_data(file_path, files, 'ball-winning', build_match_data,
+                                             event_cols=['teamId', 'eventType', 'outcomeType', 'x', 'y'],
+                                             player_cols=['team', 'teamId'])
 
-interceptions = events_df[(events_df['eventType']=='Interception') & (events_df['outcomeType']=='Successful')]
-tackles = events_df[(events_df['eventType']=='Tackle') & (events_df['outcomeType']=='Successful')]
-pass_blocks = events_df[(events_df['eventType']=='BlockedPass') & (events_df['outcomeType']=='Successful') ]
+# %% Isolate ball wins
 
-ball_wins_df = pd.concat([interceptions, tackles, pass_blocks], axis=0)
+# Successful interceptions, tackles and pass blocks, selected with a single mask
+ball_wins_df = events_df[events_df['eventType'].isin(['Interception', 'Tackle', 'BlockedPass']) &
+                         (events_df['outcomeType']=='Successful')]
 
 # %% Get teams and order on mean height of ball recovery
 
 # Sort alphabetically initially
 teams = sorted(set(players_df['team']))
 
-# Set up dictionary to store xt per 90 per team
-team_ball_win_height = dict.fromkeys(teams, 0)
+# Team id lookup, built once
+team_to_id = dict(players_df.drop_duplicates('team').set_index('team')['teamId'])
+
 team_count = len(teams)
 
-for team in teams:
-    
-    # Get team events
-    team_id = players_df[players_df['team']==team]['teamId'].values[0]
-    team_ball_wins = ball_wins_df[ball_wins_df['teamId']==team_id]
-    
-    # Get mean recovery height
-    team_ball_win_height[team] = team_ball_wins['x'].mean()
-      
-# Sort dictionary by xT/90
-team_ball_win_height = sorted(team_ball_win_height.items(), key=lambda x: x[1], reverse=True)
+# Get mean recovery height per team in one pass, and sort teams by it
+mean_ball_win_x = ball_wins_df.groupby('teamId')['x'].mean()
+team_ball_win_height = pd.Series([mean_ball_win_x.get(team_to_id[team], np.nan) for team in teams], index=teams)
+team_ball_win_height = list(team_ball_win_height.sort_values(ascending=False, kind='stable').items())
+
+# %% Load team badges
+
+# Load each team badge once, reduced to around the resolution it is drawn at
+badges = {team: lab.get_team_badge_and_colour(team) for team in teams}
+for team_logo, _ in badges.values():
+    team_logo.thumbnail((128, 128), Image.LANCZOS)
 
 # %% Custom colormap
 
@@ -139,16 +138,33 @@ fig.set_facecolor('#313332')
 ax['pitch'] = ax['pitch'].reshape(-1)
 idx = 0
 
+# Zone grid, computed once, with ascending edges for binning
+zone_bins = (6, 5)
+zone_grid = pitch.bin_statistic([0], [0], statistic='count', bins=zone_bins, normalize=False)
+xedges, yedges, flip_rows = pz.zone_grid_edges(zone_grid)
+
+# Count ball wins within each (y, x) zone for every team at once, in plotting order
+team_ids = pd.Index([team_to_id[team] for team, _ in team_ball_win_height])
+x = ball_wins_df['x'].to_numpy()
+y = ball_wins_df['y'].to_numpy()
+team_idx = team_ids.get_indexer(ball_wins_df['teamId'])
+zone_x = np.clip(np.digitize(x, xedges) - 1, 0, zone_bins[0] - 1)
+zone_y = np.clip(np.digitize(y, yedges) - 1, 0, zone_bins[1] - 1)
+if flip_rows:
+    zone_y = zone_bins[1] - 1 - zone_y
+valid = (team_idx >= 0) & (x >= xedges[0]) & (x <= xedges[-1]) & (y >= yedges[0]) & (y <= yedges[-1])
+n_zones = zone_bins[0] * zone_bins[1]
+zone_counts = np.bincount(team_idx[valid] * n_zones + zone_y[valid] * zone_bins[0] + zone_x[valid],
+                          minlength=len(team_ids) * n_zones).reshape(len(team_ids), zone_bins[1], zone_bins[0])
+
 # Loop through each team
 for team in team_ball_win_height:
     
     # Get team name and events
     team_name = team[0]
-    team_id = players_df[players_df['team']==team_name]['teamId'].values[0]
-    team_ball_wins = ball_wins_df[ball_wins_df['teamId']==team_id]
         
     # Get team logo and colour
-    team_logo, team_cmap = lab.get_team_badge_and_colour(team_name)
+    team_logo, team_cmap = badges[team_name]
     if len(team_name) > 14:
         team_name = team_name[0:13] + '...'
         
@@ -157,8 +173,7 @@ for team in team_ball_win_height:
         team_cmap = CustomCmap
 
     # Draw heatmap
-    bin_statistic = pitch.bin_statistic(team_ball_wins['x'], team_ball_wins['y'],
-                                        statistic='count', bins=(6, 5), normalize=True)
+    bin_statistic = dict(zone_grid, statistic=zone_counts[idx] / zone_counts[idx].sum())
     pitch.heatmap(bin_statistic, ax['pitch'][idx], cmap=team_cmap, edgecolor='w', lw=0.5, zorder=0, alpha=0.7)
     
     # Draw mean ball win pos
@@ -218,4 +233,5 @@ ax.axis("off")
 badge = Image.open('..\..\data_directory\misc_data\images\JK Twitter Logo.png')
 ax.imshow(badge)    
 
-fig.savefig(f"team_ball_winning/{league}-{year}-team-ball-winning", dpi=300)
\ No newline at end of file
+fig.savefig(f"team_ball_winning/{league}-{year}-team-ball-winning", dpi=300)
+plt.close(fig)
@@ -3,11 +3,13 @@
 # %% Imports and parameters
 
 import pandas as pd
-import matplotlib.pyplot as plt
 import matplotlib as mpl
+mpl.use('Agg')
+import matplotlib.pyplot as plt
 from PIL import Image, ImageEnhance
 from mplsoccer.pitch import VerticalPitch, Pitch
 import matplotlib.patheffects as path_effects
+from matplotlib.collections import LineCollection
 import os
 import sys
 import bz2
@@ -18,6 +20,56 @@ import highlight_text as htext
 import glob
 import seaborn as sns
 
+# %% Function definitions
+
+def build_match_data(file_path, files):
+    """ Load event and player data from match files, adding team names and classifying in-play passes and shots once
+    from their qualifiers, so later filters compare category codes."""
+    match_data = list(zip(files, wde.load_files(file_path, files)))
+
+    # Build dataframes with a single concatenation each
+    events_df = pd.concat([data for file, data in match_data if '-eventdata-' in file])
+    players_df = pd.concat([data for file, data in match_data if '-playerdata-' in file])
+
+    events_df = wde.add_team_name(events_df, players_df)
+
+    # Pack the qualifiers used here into a bitmask per event
+    # (bit 1: set piece pass, bit 2: cross or long ball, bit 4: set piece or penalty shot)
+    qualifier_bits = {31: 1, 34: 1, 212: 1, 59: 2, 125: 2, 126: 2, 127: 2, 128: 2, 5: 4, 6: 4, 22: 4, 135: 4}
+    sat_flags = wce.qualifier_bitmask(events_df, qualifier_bits)
+
+    # Classify in-play passes and shots once from their qualifiers, so later filters compare category codes
+    is_ip_pass = events_df['eventType'].isin(['Pass', 'OffsidePass']).to_numpy(dtype=bool) & ((sat_flags & 1) == 0)
+    is_cross_longball = (sat_flags & 2) != 0
+    is_ip_shot = events_df['eventType'].isin(['Goal', 'MissedShots', 'SavedShot', 'ShotOnPost']).to_numpy(dtype=bool) & ((sat_flags & 4) == 0)
+    events_df['pass_kind'] = pd.Categorical(np.where(is_ip_pass, np.where(is_cross_longball, 'cross_longball', 'standard'), None),
+                                            categories=['standard', 'cross_longball'])
+    events_df['shot_kind'] = pd.Categorical(np.where(is_ip_shot, 'ip_shot', None), categories=['ip_shot'])
+
+    # Downcast coordinates and threat to float32, and store low cardinality descriptors as categoricals
+    events_df = events_df.astype({'x': 'float32', 'y': 'float32', 'endX': 'float32', 'endY': 'float32',
+                                  'xThreat_gen': 'float32', 'eventType': 'category', 'team_name': 'category'})
+
+    return events_df, players_df
+
+
+def team_zone_statistic(actions, teams, xedges, yedges, zone_bins, flip_rows, values=None):
+    """ Count actions, or sum their values, within each zone of the (y, x) zone grid for every team at once. Teams are
+    indexed in the order of teams, and zones defined by the ascending xedges and yedges of a zone_bins grid, with rows
+    flipped to descending y if flip_rows is set."""
+    x = actions['x'].to_numpy()
+    y = actions['y'].to_numpy()
+    team_idx = teams.get_indexer(actions['team_name'])
+    zone_x = np.clip(np.digitize(x, xedges) - 1, 0, zone_bins[0] - 1)
+    zone_y = np.clip(np.digitize(y, yedges) - 1, 0, zone_bins[1] - 1)
+    if flip_rows:
+        zone_y = zone_bins[1] - 1 - zone_y
+    valid = (team_idx >= 0) & (x >= xedges[0]) & (x <= xedges[-1]) & (y >= yedges[0]) & (y <= yedges[-1])
+    weights = None if values is None else actions[values].to_numpy()[valid]
+    n_zones = zone_bins[0] * zone_bins[1]
+    return np.bincount(team_idx[valid] * n_zones + zone_y[valid] * zone_bins[0] + zone_x[valid], weights=weights,
+                       minlength=len(teams) * n_zones).reshape(len(teams), zone_bins[1], zone_bins[0]).astype(float)
+
 # %% Add custom tools to path
 
 root_folder = os.path.abspath(os.path.dirname(
@@ -75,32 +127,13 @@ comp_logo = lab.get_competition_logo(league, year, logo_brighten=logo_brighten)
 # %% Get event data for current year
 
 file_path = f"../../data_directory/whoscored_data/{year}_{str(int(year.replace('20','')) + 1)}/{league}"
-files = os.listdir(file_path)
-
-# Initialise storage dataframes
-events_df = pd.DataFrame()
-players_df = pd.DataFrame()
-
-# Load data
-for file in files:
-    if file == 'event-types.pbz2':
-        event_types = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        event_types = pickle.load(event_types)
-    elif file == 'formation-mapping.pbz2':
-        formation_mapping = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        formation_mapping = pickle.load(formation_mapping)
-    elif '-eventdata-' in file:
-        match_events = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        match_events = pickle.load(match_events)
-        events_df = pd.concat([events_df, match_events])
-    elif '-playerdata-' in file:
-        match_players = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        match_players = pickle.load(match_players)
-        players_df = pd.concat([players_df, match_players])
-    else:
-        pass
-
-events_df = wde.add_team_name(events_df, players_df)
+files = [file for file in os.listdir(file_path) if file.endswith('.pbz2')]
+
+# Read loaded and tagged data from cache if source files and processing are unchanged since last run, keeping only
+# the event columns used in this analysis
+events_df, players_df = wde.load_cached_data(file_path, files, 'common-zonal-actions-tagged', build_match_data,
+                                             event_cols=['x', 'y', 'endX', 'endY', 'eventType', 'pass_kind',
+                                                         'shot_kind', 'team_name', 'xThreat_gen'])
 
 # %% Get league table data
 
@@ -113,85 +146,62 @@ league_table['team'] = league_table['team'].apply(team_name_clean)
 # %% Isolate different event types that will be counted
 
 # Passes
-ip_passes = events_df[(events_df['eventType'].isin(['Pass', 'OffsidePass'])) & (~events_df['satisfiedEventsTypes'].apply(lambda x: True if (31 in x or 34 in x or 212 in x) else False))].reset_index(drop=True)
+ip_passes = events_df[events_df['pass_kind'].notna()].reset_index(drop=True)
                                                          
 # Shots
-ip_shots = events_df[(events_df['eventType'].isin(['Goal', 'MissedShots', 'SavedShot', 'ShotOnPost'])) & (~events_df['satisfiedEventsTypes'].apply(lambda x: True if (5 in x or 6 in x or 22 in x or 135 in x) else False))].reset_index(drop=True)
+ip_shots = events_df[events_df['shot_kind'] == 'ip_shot'].reset_index(drop=True)
                      
 # Carries                   
 carries = events_df[events_df['eventType']=='Carry']
 
 # Crosses or long balls
-cross_longballs = ip_passes[ip_passes['satisfiedEventsTypes'].apply(lambda x: 59 in x or 125 in x or 126 in x or 127 in x or 128 in x)]
+cross_longballs = ip_passes[ip_passes['pass_kind'] == 'cross_longball']
 
 # %% Breakdown standard passes by direction
 
-def pass_direction(df_row, side_angle):
-    xs = df_row['x']
-    ys = df_row['y']
-    xe = df_row['endX']
-    ye = df_row['endY']
-    dx = 120*(xe - xs)
-    dy = 80*(ye - ys)
-    ang =  np.rad2deg(np.arctan2(dx, dy))
-    if (ang > side_angle) and (ang < 180-side_angle):
-        direction = 'fwd'
-    elif (ang > -180 + side_angle) and (ang < -side_angle):
-        direction = 'back'
-    else:
-        direction = 'side'
-    return ang, direction
-    
-
 # Standard passes
-standardpasses = ip_passes.loc[~ip_passes.index.isin(list(cross_longballs.index))]
-standardpasses[['angle', 'direction']] = standardpasses.apply(pass_direction, side_angle = side_angle, result_type = 'expand', axis=1)
+standardpasses = ip_passes[ip_passes['pass_kind'] == 'standard']
+
+# Calculate pass angle and direction across all standard passes at once
+xs = standardpasses['x'].to_numpy()
+ys = standardpasses['y'].to_numpy()
+xe = standardpasses['endX'].to_numpy()
+ye = standardpasses['endY'].to_numpy()
+ang = np.rad2deg(np.arctan2(120*(xe - xs), 80*(ye - ys)))
+direction = np.where((ang > side_angle) & (ang < 180-side_angle), 'fwd',
+                     np.where((ang > -180 + side_angle) & (ang < -side_angle), 'back', 'side'))
+standardpasses = standardpasses.assign(angle = ang, direction = direction)
 forwardpasses = standardpasses[standardpasses['direction'] == 'fwd']
 backpasses = standardpasses[standardpasses['direction'] == 'back']
 sidepasses = standardpasses[standardpasses['direction'] == 'side']
 
 # %% Calculate count of action within each zone
 
-all_common_action_bins = list()
+pitch = Pitch(pitch_type='opta')
+
+# Zone grid, computed once and used to bin every team's actions
+zone_bins = (6, 5)
+zone_grid = pitch.bin_statistic([0], [0], statistic='count', bins=zone_bins, normalize=False)
+xedges, yedges, flip_rows = pz.zone_grid_edges(zone_grid)
+
+# Teams in league table order, used to index every per-team array
+teams = pd.Index(league_table['team'].tolist())
+
+# Bin every action type for all teams, stacked in colour code order so argmax picks the lowest code on ties
+stat_values = 'xThreat_gen' if mode == 'threat' else None
+action_stack = np.stack([team_zone_statistic(ip_shots, teams, xedges, yedges, zone_bins, flip_rows, stat_values),
+                         team_zone_statistic(cross_longballs, teams, xedges, yedges, zone_bins, flip_rows, stat_values),
+                         team_zone_statistic(carries, teams, xedges, yedges, zone_bins, flip_rows, stat_values),
+                         team_zone_statistic(forwardpasses, teams, xedges, yedges, zone_bins, flip_rows, stat_values),
+                         team_zone_statistic(backpasses, teams, xedges, yedges, zone_bins, flip_rows, stat_values),
+                         team_zone_statistic(sidepasses, teams, xedges, yedges, zone_bins, flip_rows, stat_values)])
+common_actions = np.argmax(action_stack, axis=0).astype(np.int8)
+if mode == 'threat':
+    common_actions[:, 2, 5] = 0
+
+# Heatmap template, with each team's statistic swapped in when plotting
+common_action_bin = dict(zone_grid)
 
-for team in league_table['team'].tolist():
-    team_shots = ip_shots[ip_shots['team_name'] == team]
-    team_carries = carries[carries['team_name'] == team]
-    team_cross_longballs = cross_longballs[cross_longballs['team_name'] == team]
-    team_backpasses = backpasses[backpasses['team_name'] == team]
-    team_forwardpasses = forwardpasses[forwardpasses['team_name'] == team]
-    team_sidepasses = sidepasses[sidepasses['team_name'] == team]
-        
-    pitch = Pitch(pitch_type='opta')
-    if mode == 'threat':
-        bin_shots = pitch.bin_statistic(team_shots['x'], team_shots['y'], statistic='sum', bins=(6, 5) , values = team_shots['xThreat_gen'],normalize=False)
-        bin_carries = pitch.bin_statistic(team_carries['x'], team_carries['y'], statistic='sum', bins=(6, 5), values = team_carries['xThreat_gen'], normalize=False)
-        bin_crosses_longballs = pitch.bin_statistic(team_cross_longballs['x'], team_cross_longballs['y'], statistic='sum', bins=(6, 5), values = team_cross_longballs['xThreat_gen'], normalize=False)
-        bin_backpasses = pitch.bin_statistic(team_backpasses['x'], team_backpasses['y'], statistic='sum', bins=(6, 5), values = team_backpasses['xThreat_gen'], normalize=False)
-        bin_forwardpasses = pitch.bin_statistic(team_forwardpasses['x'], team_forwardpasses['y'], statistic='sum', bins=(6, 5), values = team_forwardpasses['xThreat_gen'], normalize=False)
-        bin_sidepasses = pitch.bin_statistic(team_sidepasses['x'], team_sidepasses['y'], statistic='sum', bins=(6, 5), values = team_sidepasses['xThreat_gen'], normalize=False)      
-    else:
-        bin_shots = pitch.bin_statistic(team_shots['x'], team_shots['y'], statistic='count', bins=(6, 5), normalize=False)
-        bin_carries = pitch.bin_statistic(team_carries['x'], team_carries['y'], statistic='count', bins=(6, 5), normalize=False)
-        bin_crosses_longballs = pitch.bin_statistic(team_cross_longballs['x'], team_cross_longballs['y'], statistic='count', bins=(6, 5), normalize=False)
-        bin_backpasses = pitch.bin_statistic(team_backpasses['x'], team_backpasses['y'], statistic='count', bins=(6, 5), normalize=False)
-        bin_forwardpasses = pitch.bin_statistic(team_forwardpasses['x'], team_forwardpasses['y'], statistic='count', bins=(6, 5), normalize=False)
-        bin_sidepasses = pitch.bin_statistic(team_sidepasses['x'], team_sidepasses['y'], statistic='count', bins=(6, 5), normalize=False)
-   
-    bin_max = np.maximum.reduce([bin_shots['statistic'], bin_carries['statistic'], bin_crosses_longballs['statistic'], bin_backpasses['statistic'],
-                         bin_forwardpasses['statistic'], bin_sidepasses['statistic']])
-    
-    common_action_bin = pitch.bin_statistic(team_shots['x'], team_shots['y'], statistic='count', bins=(6, 5) , normalize=False)
-    common_action_bin['statistic'][bin_sidepasses['statistic'] == bin_max] = 5
-    common_action_bin['statistic'][bin_backpasses['statistic'] == bin_max] = 4
-    common_action_bin['statistic'][bin_forwardpasses['statistic'] == bin_max] = 3
-    common_action_bin['statistic'][bin_carries['statistic'] == bin_max] = 2
-    common_action_bin['statistic'][bin_crosses_longballs['statistic'] == bin_max] = 1
-    common_action_bin['statistic'][bin_shots['statistic'] == bin_max] = 0
-    if mode == 'threat':
-      common_action_bin['statistic'][2,5] = 0
-    all_common_action_bins.append(common_action_bin)
-    
 # %% Define colours for each action
 
 shot_col = "khaki"
@@ -206,12 +216,13 @@ CustomCmap = mpl.colors.LinearSegmentedColormap.from_list("", [shot_col, cross_l
 # %% Create visual
 
 # Overwrite rcparams
+mpl.rcParams['figure.autolayout'] = False
 mpl.rcParams['xtick.color'] = 'w'
 mpl.rcParams['ytick.color'] = 'w'
 
 # Define grid dimensions
 ncols = 4
-nrows = int(np.ceil(len(all_common_action_bins)/ncols))  
+nrows = int(np.ceil(len(common_actions)/ncols))  
 
 # Set-up pitch subplots
 pitch = Pitch(pitch_color='#313332', pitch_type='opta', line_color='white', linewidth=1, stripe=False)
@@ -225,7 +236,7 @@ idx = 0
 for idx, team in enumerate(league_table['team'].tolist()):
     
     # Get team heatmap
-    team_common_action_bins = all_common_action_bins[idx]
+    common_action_bin['statistic'] = common_actions[idx]
         
     # Get team logo and colour
     team_logo, _ = lab.get_team_badge_and_colour(team)
@@ -234,7 +245,7 @@ for idx, team in enumerate(league_table['team'].tolist()):
         team_name = team_name[0:13] + '...'
         
     # Draw heatmap
-    pitch.heatmap(team_common_action_bins, ax['pitch'][idx], cmap=CustomCmap, edgecolor='#313332', lw=0.5, zorder=0.6, alpha=0.5, vmin=0, vmax=5)
+    pitch.heatmap(common_action_bin, ax['pitch'][idx], cmap=CustomCmap, edgecolor='#313332', lw=0.5, zorder=0.6, alpha=0.5, vmin=0, vmax=5, rasterized=True)
 
     ax['pitch'][idx].set_title(f"  {idx + 1}:  {team_name}", loc = "left", color='w', fontsize = 16)
     
@@ -287,6 +298,7 @@ badge = Image.open('..\..\data_directory\misc_data\images\JK Twitter Logo.png')
 ax.imshow(badge)    
 
 fig.savefig(f"team_common_actions/{league}-{year}-team_common_actions-{mode}", dpi=300)
+plt.close(fig)
 
 # %% Create visual
 
@@ -298,7 +310,17 @@ fig.set_facecolor('#313332')
 
 b = sidepasses.head(1000)
 
-pitch.lines(b['x'], b['y'], b['endX'], b['endY'], ax = ax['pitch'],lw = 3, comet=True, transparent=True)
+# Draw comet lines as one collection of sub-segments, with width and alpha ramping up along each pass
+n_segments = 8
+frac = np.linspace(0, 1, n_segments + 1)
+start = np.column_stack([b['x'], b['y']])
+end = np.column_stack([b['endX'], b['endY']])
+points = start[:, np.newaxis, :] + frac[np.newaxis, :, np.newaxis] * (end - start)[:, np.newaxis, :]
+segments = np.stack([points[:, :-1], points[:, 1:]], axis=2).reshape(-1, 2, 2)
+ramp = np.tile(frac[1:], len(b))
+line_colours = np.tile(mpl.colors.to_rgba(mpl.rcParams['lines.color']), (len(segments), 1))
+line_colours[:, 3] = ramp
+ax['pitch'].add_collection(LineCollection(segments, linewidths=3*ramp, colors=line_colours, capstyle='round', rasterized=True))
 
 
 
@@ -10,20 +10,59 @@
 # %% Imports and parameters
 
 import pandas as pd
-import matplotlib.pyplot as plt
 import matplotlib as mpl
+mpl.use('Agg')
+import matplotlib.pyplot as plt
 from PIL import Image, ImageEnhance
 from mplsoccer.pitch import VerticalPitch, Pitch
 import matplotlib.patheffects as path_effects
 import os
 import sys
-import bz2
-import pickle
 import numpy as np
 from collections import Counter
 import highlight_text as htext
 import glob
-from scipy.spatial import Delaunay
+
+# %% Function definitions
+
+def next_event_mins(actions, events, by):
+    """ Get the time of the first event strictly after each action, matching on the columns in by. Actions with no
+    following event, or without a time, are given NaN, and events without a time are ignored."""
+    left = (actions[['cumulative_mins'] + by].dropna(subset=by + ['cumulative_mins']).reset_index()
+            .sort_values('cumulative_mins'))
+    right = (events[['cumulative_mins'] + by].dropna(subset=by + ['cumulative_mins'])
+             .rename(columns={'cumulative_mins': 'next_mins'}).sort_values('next_mins'))
+    next_events = pd.merge_asof(left, right, left_on='cumulative_mins', right_on='next_mins', by=by,
+                                direction='forward', allow_exact_matches=False)
+    return next_events.set_index('index')['next_mins'].reindex(actions.index)
+
+
+def build_match_data(file_path, files):
+    """ Load event and player data from match files, adding cumulative minutes, team names and a bitmask of the
+    qualifiers used here. Coordinates are downcast to float32, and low cardinality descriptors stored as categoricals
+    so equality and isin filters compare integer codes."""
+    match_data = list(zip(files, wde.load_files(file_path, files)))
+
+    # Build dataframes with a single concatenation each
+    events_df = pd.concat([data for file, data in match_data if '-eventdata-' in file])
+    players_df = pd.concat([data for file, data in match_data if '-playerdata-' in file])
+
+    # Get cumulative minutes info
+    events_df = wde.cumulative_match_mins(events_df)
+    events_df = wde.add_team_name(events_df, players_df)
+
+    # Pack the qualifiers used here into a bitmask per event
+    # (bit 1: cross, bit 2: set piece, bit 4: key pass, bit 8: assist)
+    qualifier_bits = {125: 1, 126: 1, 31: 2, 34: 2, 212: 2, 39: 4, 40: 4, 41: 4, 42: 4, 43: 4, 44: 4, 45: 4, 46: 4,
+                      92: 8}
+    sat_flags = wce.qualifier_bitmask(events_df, qualifier_bits)
+    events_df['sat_flags'] = sat_flags
+
+    events_df = events_df.astype({'x': 'float32', 'y': 'float32', 'endX': 'float32', 'endY': 'float32',
+                                  'eventType': 'category', 'outcomeType': 'category'})
+    players_df = players_df.astype({'team': 'category'})
+
+    return events_df, players_df
 
 # %% Add custom tools to path
 
@@ -60,69 +99,56 @@ comp_logo = lab.get_competition_logo(league, year, logo_brighten=logo_brighten)
 # %% Get data
 
 file_path = f"../../data_directory/whoscored_data/{year}_{str(int(year.replace('20','')) + 1)}/{league}"
-files = os.listdir(file_path)
-
-# Initialise storage dataframes
-events_df = pd.DataFrame()
-players_df = pd.DataFrame()
-
-# Load data
-for file in files:
-    if file == 'event-types.pbz2':
-        event_types = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        event_types = pickle.load(event_types)
-    elif file == 'formation-mapping.pbz2':
-        formation_mapping = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        formation_mapping = pickle.load(formation_mapping)
-    elif '-eventdata-' in file:
-        match_events = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        match_events = pickle.load(match_events)
-        events_df = pd.concat([events_df, match_events])
-    elif '-playerdata-' in file:
-        match_players = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        match_players = pickle.load(match_players)
-        players_df = pd.concat([players_df, match_players])
-    else:
-        pass
-
-# %% Get cumulative minutes info
-
-events_df = wde.cumulative_match_mins(events_df)
-events_df = wde.add_team_name(events_df, players_df)
+event_files = [os.path.basename(file) for file in glob.glob(f"{file_path}/*-eventdata-*.pbz2")]
+player_files = [os.path.basename(file) for file in glob.glob(f"{file_path}/*-playerdata-*.pbz2")]
+files = event_files + player_files
+
+# Read loaded and processed data from cache if source files and processing are unchanged since last run, keeping only
+# the event and player columns used in this analysis
+events_df, players_df = wde.load_cached_data(file_path, files, 'cross-success', build_match_data,
+                                             event_cols=['match_id', 'period', 'teamId', 'cumulative_mins', 'eventType',
+                                                         'outcomeType', 'x', 'y', 'endX', 'endY', 'sat_flags'],
+                                             player_cols=['team', 'teamId'])
 
 # %% Get crosses
 
-all_crosses = events_df[(events_df['eventType']=='Pass') & (abs(events_df['endY'] - events_df['y']) >= 10) & (events_df['satisfiedEventsTypes'].apply(lambda x: True if (125 in x or 126 in x) else False))]
-open_play_crosses = all_crosses[~all_crosses['satisfiedEventsTypes'].apply(lambda x: True if (31 in x or 34 in x or 212 in x) else False)]
+# Narrow to passes first, so the qualifier and width tests only run over the candidate subset
+passes = events_df[events_df['eventType']=='Pass']
+all_crosses = passes[((passes['sat_flags'] & 1) != 0) & (np.abs(passes['endY'].to_numpy() - passes['y'].to_numpy()) >= 10)]
+open_play_crosses = all_crosses[(all_crosses['sat_flags'] & 2) == 0]
 
 # %% Calculate pressure action retention (bespoke method for carries)
 
-# Add new column to categorise cross
 open_play_crosses = open_play_crosses.reset_index(drop=True)
-open_play_crosses.loc[:,'cross_outcome'] = np.nan
-
-for idx, cross in open_play_crosses.iterrows():
-    next_evts = events_df[(events_df['match_id'] == cross['match_id']) & (events_df['period'] == cross['period']) & (events_df['cumulative_mins'] > cross['cumulative_mins']) & (events_df['cumulative_mins'] <= cross['cumulative_mins']+(5/60))]
-    team_next_evts = next_evts[next_evts['teamId'] == cross['teamId']]
-    if (cross['endX'] == 100) | (cross['endY'] == 100) | (cross['endY'] == 0):
-        open_play_crosses.loc[idx, 'cross_outcome'] = 'Unsuccessful'
-    else:
-        if ('Goal' in next_evts['eventType'].tolist()) or (92 in cross['satisfiedEventsTypes']):
-            open_play_crosses.loc[idx, 'cross_outcome'] = 'Goal'
-        elif ('SavedShot' in team_next_evts['eventType'].tolist()) or ('ShotOnPost' in team_next_evts['eventType'].tolist()) or ('MissedShots' in team_next_evts['eventType'].tolist()):
-            open_play_crosses.loc[idx, 'cross_outcome'] = 'Shot'
-        elif bool(set([item for sublist in next_evts['satisfiedEventsTypes'].tolist() for item in sublist]) & set(np.arange(39,47))):
-            open_play_crosses.loc[idx, 'cross_outcome'] = 'Key Pass'
-        elif cross['outcomeType'] == 'Successful':
-            open_play_crosses.loc[idx, 'cross_outcome'] = 'To Team-mate'
-        else:
-            open_play_crosses.loc[idx, 'cross_outcome'] = 'Unsuccessful'
+
+# Find whether a goal, team shot or key pass follows each cross within 5 seconds, from the first such event after it
+window_end = open_play_crosses['cumulative_mins'] + (5/60)
+goals = events_df[events_df['eventType']=='Goal']
+shots = events_df[events_df['eventType'].isin(['SavedShot', 'ShotOnPost', 'MissedShots'])]
+key_passes = events_df[(events_df['sat_flags'] & 4) != 0]
+goal_follows = ((next_event_mins(open_play_crosses, goals, ['match_id', 'period']) <= window_end) |
+                ((open_play_crosses['sat_flags'] & 8) != 0))
+shot_follows = next_event_mins(open_play_crosses, shots, ['match_id', 'period', 'teamId']) <= window_end
+key_pass_follows = next_event_mins(open_play_crosses, key_passes, ['match_id', 'period']) <= window_end
+out_of_play = (open_play_crosses['endX'] == 100) | (open_play_crosses['endY'] == 100) | (open_play_crosses['endY'] == 0)
+
+# Add new column to categorise cross
+open_play_crosses['cross_outcome'] = np.select([out_of_play, goal_follows, shot_follows, key_pass_follows,
+                                                open_play_crosses['outcomeType'] == 'Successful'],
+                                               ['Unsuccessful', 'Goal', 'Shot', 'Key Pass', 'To Team-mate'],
+                                               default='Unsuccessful')
 
 # %% Get teams and order on count of effective crosses
 
 # Sort alphabetically initially
 teams = sorted(set(players_df['team']))
 
+# Team id lookup and crosses split by team, built once
+team_to_id = dict(players_df.drop_duplicates('team').set_index('team')['teamId'])
+crosses_by_team = dict(tuple(open_play_crosses.groupby('teamId', sort=False)))
+crosses_by_outcome = dict(tuple(open_play_crosses.groupby(['teamId', 'cross_outcome'], sort=False)))
+no_crosses = open_play_crosses.iloc[0:0]
+
 # Set up dictionary to cross count per team
 team_effective_cross = dict.fromkeys(teams, 0)
 team_count = len(teams)
@@ -130,8 +156,8 @@ team_count = len(teams)
 for team in teams:
     
     # Get team events
-    team_id = players_df[players_df['team']==team]['teamId'].values[0]
-    team_crosses = open_play_crosses[open_play_crosses['teamId']==team_id]
+    team_id = team_to_id[team]
+    team_crosses = crosses_by_team.get(team_id, no_crosses)
     team_effective_crosses = team_crosses[team_crosses['cross_outcome'].isin(['Goal', 'Shot', 'Key Pass'])]
     
     # Get cross pct
@@ -140,6 +166,13 @@ for team in teams:
 # Sort cross count
 team_effective_cross = sorted(team_effective_cross.items(), key=lambda x: x[1], reverse=True)        
 
+# %% Load team badges
+
+# Load each team badge once, reduced to around the resolution it is drawn at
+badges = {team: lab.get_team_badge_and_colour(team) for team in teams}
+for team_logo, _ in badges.values():
+    team_logo.thumbnail((128, 128), Image.LANCZOS)
+
 # %% Create visual
 
 # Overwrite rcparams
@@ -168,15 +201,16 @@ for team in team_effective_cross:
     
     # Get team name and events
     team_name = team[0]
-    team_id = players_df[players_df['team']==team_name]['teamId'].values[0]
-    team_crosses = open_play_crosses[open_play_crosses['teamId']==team_id]
-    team_unsuc_crosses = team_crosses[team_crosses['cross_outcome']=='Unsuccessful']
-    team_suc_crosses = team_crosses[team_crosses['cross_outcome']=='To Team-mate']
-    team_key_crosses = team_crosses[team_crosses['cross_outcome'].isin(['Shot','Key Pass'])]
-    team_goal_crosses = team_crosses[team_crosses['cross_outcome']=='Goal']
+    team_id = team_to_id[team_name]
+    team_crosses = crosses_by_team.get(team_id, no_crosses)
+    team_unsuc_crosses = crosses_by_outcome.get((team_id, 'Unsuccessful'), no_crosses)
+    team_suc_crosses = crosses_by_outcome.get((team_id, 'To Team-mate'), no_crosses)
+    team_key_crosses = pd.concat([crosses_by_outcome.get((team_id, 'Shot'), no_crosses),
+                                  crosses_by_outcome.get((team_id, 'Key Pass'), no_crosses)])
+    team_goal_crosses = crosses_by_outcome.get((team_id, 'Goal'), no_crosses)
 
     # Get team logo and colour
-    team_logo, _ = lab.get_team_badge_and_colour(team_name)
+    team_logo, _ = badges[team_name]
     
     # Plot unsuccessful crosses
     pitch.lines(team_unsuc_crosses['x'], team_unsuc_crosses['y'], team_unsuc_crosses['endX'], team_unsuc_crosses['endY'],
@@ -187,18 +221,16 @@ for team in team_effective_cross:
                 color = normal_col, alpha = 0.3, zorder = 2, lw = 1,ax = ax['pitch'][idx])
 
     # Plot key crosses
-    for _, cross in team_key_crosses.iterrows():    
-        pitch.lines(cross['x'], cross['y'], cross['endX'], cross['endY'],
-                    color = key_col, alpha = 0.7, zorder = 3, lw = 1,ax = ax['pitch'][idx])
-        pitch.scatter(cross['endX'], cross['endY'], color = key_col, alpha = 0.7, s=15, ax = ax['pitch'][idx], zorder = 4)
-        pitch.scatter(cross['endX'], cross['endY'], color = '#313332', alpha = 1, s=5, ax = ax['pitch'][idx], zorder = 4)
+    pitch.lines(team_key_crosses['x'], team_key_crosses['y'], team_key_crosses['endX'], team_key_crosses['endY'],
+                color = key_col, alpha = 0.7, zorder = 3, lw = 1,ax = ax['pitch'][idx])
+    pitch.scatter(team_key_crosses['endX'], team_key_crosses['endY'], color = key_col, alpha = 0.7, s=15, ax = ax['pitch'][idx], zorder = 4)
+    pitch.scatter(team_key_crosses['endX'], team_key_crosses['endY'], color = '#313332', alpha = 1, s=5, ax = ax['pitch'][idx], zorder = 4)
 
     # Plot cross assists
-    for _, cross in team_goal_crosses.iterrows():    
-        pitch.lines(cross['x'], cross['y'], cross['endX'], cross['endY'],
-                    color = assist_col, alpha = 0.8, zorder = 4, lw = 1,ax = ax['pitch'][idx])
-        pitch.scatter(cross['endX'], cross['endY'], color = assist_col, alpha = 0.8, s=15, ax = ax['pitch'][idx], zorder = 5)
-        pitch.scatter(cross['endX'], cross['endY'], color = '#313332', alpha = 1, s=5, ax = ax['pitch'][idx], zorder = 5)
+    pitch.lines(team_goal_crosses['x'], team_goal_crosses['y'], team_goal_crosses['endX'], team_goal_crosses['endY'],
+                color = assist_col, alpha = 0.8, zorder = 4, lw = 1,ax = ax['pitch'][idx])
+    pitch.scatter(team_goal_crosses['endX'], team_goal_crosses['endY'], color = assist_col, alpha = 0.8, s=15, ax = ax['pitch'][idx], zorder = 5)
+    pitch.scatter(team_goal_crosses['endX'], team_goal_crosses['endY'], color = '#313332', alpha = 1, s=5, ax = ax['pitch'][idx], zorder = 5)
     
     # Find box containing most points
     x_min = 50
@@ -207,37 +239,31 @@ for team in team_effective_cross:
     y_max = 100
     x_range = 12.5
     y_range = 17.5
+    step = 2.5
     
-    in_hull_dict = dict()
+    # Place cross origins on a half-step lattice (even positions on grid lines, odd positions between them) so boxes
+    # include crosses on their edges, then read every box count from a summed-area table of the lattice
+    eff_crosses = pd.concat([team_goal_crosses, team_key_crosses], axis=0)
+    x_steps = (eff_crosses['x'].to_numpy() - x_min)/step
+    y_steps = (eff_crosses['y'].to_numpy() - y_min)/step
+    lattice, _, _ = np.histogram2d(np.floor(x_steps) + np.ceil(x_steps), np.floor(y_steps) + np.ceil(y_steps),
+                                   bins=[np.arange(-0.5, 2*(x_max-x_min)/step + 1), np.arange(-0.5, 2*(y_max-y_min)/step + 1)])
+    summed = np.pad(lattice.cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
     
-    for x in np.arange(x_min, x_max-x_range+1, 2.5):
-        x1 = x
-        x2 = x + x_range
-        for y in np.arange(y_min, y_max-y_range+1, 2.5):
-            y1 = y
-            y2 = y + y_range
-            
-            hull = [(x1,y1), (x2,y1), (x2,y2), (x1,y2)]
-            in_hull_cnt = 0
-            
-            for _, cross in pd.concat([team_goal_crosses, team_key_crosses], axis=0).iterrows():
-                
-                p = [cross['x'], cross['y']]
-                
-                if not isinstance(hull, Delaunay):
-                    hull = Delaunay(hull)
-                
-                if hull.find_simplex(p) >= 0:
-                    in_hull_cnt += 1
-            
-            in_hull_dict[(x1,y1,x2,y2)] = in_hull_cnt
+    x_start = 2*np.arange(int((x_max-x_range-x_min)/step) + 1)[:, np.newaxis]
+    y_start = 2*np.arange(int((y_max-y_range-y_min)/step) + 1)[np.newaxis, :]
+    x_end = x_start + int(2*x_range/step) + 1
+    y_end = y_start + int(2*y_range/step) + 1
+    box_counts = (summed[x_end, y_end] - summed[x_start, y_end] - summed[x_end, y_start] + summed[x_start, y_start]).astype(int)
     
-    zone_st = max(in_hull_dict, key=in_hull_dict.get)
+    # Take the first box with the most crosses, ordered by x then y
+    box_x, box_y = np.unravel_index(np.argmax(box_counts), box_counts.shape)
+    zone_st = (x_min + step*box_x, y_min + step*box_y, x_min + step*box_x + x_range, y_min + step*box_y + y_range)
     ax['pitch'][idx].fill([zone_st[1], zone_st[3], zone_st[3], zone_st[1]], [zone_st[0], zone_st[0], zone_st[2], zone_st[2]],
                           edgecolor = 'w', facecolor='#313332', hatch = "////\\\\\\\\", alpha = 0.7, zorder=0)
 
     path_eff = [path_effects.Stroke(linewidth=3, foreground='#313332'), path_effects.Normal()]
-    ax['pitch'][idx].text(zone_st[1], zone_st[0], max(in_hull_dict.values()), color = "w", fontsize = 8, fontweight = "bold", va = "center", ha = "center", path_effects=path_eff)
+    ax['pitch'][idx].text(zone_st[1], zone_st[0], box_counts.max(), color = "w", fontsize = 8, fontweight = "bold", va = "center", ha = "center", path_effects=path_eff)
         
     # Add axis text
     ax['pitch'][idx].text(98, 56, "Crosses:", color = "w", fontsize = 6, fontweight = "bold", va = "center")
@@ -297,3 +323,4 @@ badge = Image.open('..\..\data_directory\misc_data\images\JK Twitter Logo.png')
 ax.imshow(badge)    
 
 fig.savefig(f"team_cross_success/{league}-{year}-team_cross_success", dpi=300)
+plt.close(fig)
@@ -17,10 +17,9 @@ from PIL import Image, ImageEnhance
 from mplsoccer.pitch import VerticalPitch, Pitch
 import matplotlib.patheffects as path_effects
 import matplotlib.cm as cm
+from matplotlib.offsetbox import OffsetImage, AnnotationBbox
 import os
 import sys
-import bz2
-import pickle
 import numpy as np
 from collections import Counter
 import highlight_text as htext
@@ -37,6 +36,46 @@ import analysis_tools.pitch_zones as pz
 import analysis_tools.whoscored_data_engineering as wde
 import analysis_tools.logos_and_badges as lab
 
+# %% Function definitions
+
+def matching_files(files, teams):
+    """ Select event and player data files for matches involving at least one of the teams, splitting each file name
+    once to read the home and away team tokens."""
+    selected_files = list()
+    for file in files:
+        if '-eventdata-' not in file and '-playerdata-' not in file:
+            continue
+        parts = file.split('-')
+        if len(parts) > 4 and (parts[3] in teams or parts[4].replace('.pbz2', '') in teams):
+            selected_files.append(file)
+    return selected_files
+
+
+# Event and player columns used in this analysis
+event_cols = ['match_id', 'teamId', 'x', 'y', 'cumulative_mins', 'xThreat', 'xThreat_gen', 'satisfiedEventsTypes']
+player_cols = ['team', 'teamId']
+
+# Compact dtypes for event columns, halving the bytes scanned by the groupby and mask passes
+event_dtypes = {'teamId': 'int32', 'x': 'float32', 'y': 'float32', 'cumulative_mins': 'float32', 'xThreat': 'float32',
+                'xThreat_gen': 'float32'}
+
+
+def build_match_data(file_path, files):
+    """ Load event and player data from match files, using compact dtypes for the event columns."""
+    match_data = list(zip(files, wde.load_files(file_path, files)))
+
+    # Build dataframes with a single concatenation each
+    events_df = pd.concat([data for file, data in match_data if '-eventdata-' in file]).astype(event_dtypes)
+    players_df = pd.concat([data for file, data in match_data if '-playerdata-' in file])
+
+    return events_df, players_df
+
+
+def load_match_data(file_path, files, cache_name):
+    """ Load the used event and player columns from match files, reading from a parquet cache if the files and their
+    processing are unchanged since the cache was written, and writing the cache otherwise."""
+    return wde.load_cached_data(file_path, files, cache_name, build_match_data, event_cols=event_cols,
+                                player_cols=player_cols)
 
 # %% User Inputs
 
@@ -64,30 +103,8 @@ comp_logo = lab.get_competition_logo(league, year, logo_brighten=logo_brighten)
 # %% Get data for current year, selected league
 
 file_path = f"../../data_directory/whoscored_data/{year}_{str(int(year.replace('20','',1)) + 1)}/{league}"
-files = os.listdir(file_path)
-
-# Initialise storage dataframes
-events_df = pd.DataFrame()
-players_df = pd.DataFrame()
-
-# Load data
-for file in files:
-    if file == 'event-types.pbz2':
-        event_types = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        event_types = pickle.load(event_types)
-    elif file == 'formation-mapping.pbz2':
-        formation_mapping = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        formation_mapping = pickle.load(formation_mapping)
-    elif '-eventdata-' in file:
-        match_events = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        match_events = pickle.load(match_events)
-        events_df = pd.concat([events_df, match_events])
-    elif '-playerdata-' in file:
-        match_players = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        match_players = pickle.load(match_players)
-        players_df = pd.concat([players_df, match_players])
-    else:
-        pass
+files = [file for file in os.listdir(file_path) if '-eventdata-' in file or '-playerdata-' in file]
+events_df, players_df = load_match_data(file_path, files, 'delta-threat')
 
 # %% Identify all teams in selected league, current year
 
@@ -97,50 +114,20 @@ all_teams = set(players_df['team'])
 
 year_before = int(year)-1
 file_path = f"../../data_directory/whoscored_data/{year_before}_{str(int(str(year_before).replace('20','')) + 1)}/{league}"
-files = os.listdir(file_path)
-
-# Initialise storage dataframes
-events_prev_df = pd.DataFrame()
-players_prev_df = pd.DataFrame()
-
-# Load data
-for file in files:
-    if '-eventdata-' in file:
-        if (file.split('-')[3] in all_teams) or (file.split('-')[4].replace('.pbz2','') in all_teams):
-            match_events = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-            match_events = pickle.load(match_events)
-            events_prev_df = pd.concat([events_prev_df, match_events])
-    elif '-playerdata-' in file:
-        if (file.split('-')[3] in all_teams) or (file.split('-')[4].replace('.pbz2','') in all_teams):
-            match_players = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-            match_players = pickle.load(match_players)
-            players_prev_df = pd.concat([players_prev_df, match_players])
-    else:
-        pass
+
+# Only load match files involving a team in the selected league
+files = matching_files(os.listdir(file_path), all_teams)
+
+events_prev_df, players_prev_df = load_match_data(file_path, files, 'delta-threat')
 
 # %% Get data for current year, league below selected league
 
 file_path = f"../../data_directory/whoscored_data/{year_before}_{str(int(str(year_before).replace('20','')) + 1)}/{league_below}"
-files = os.listdir(file_path)
-
-# Initialise storage dataframes
-events_prev_below_df = pd.DataFrame()
-players_prev_below_df = pd.DataFrame()
-
-# Load data
-for file in files:
-    if '-eventdata-' in file:
-        if (file.split('-')[3] in all_teams) or (file.split('-')[4].replace('.pbz2','') in all_teams):
-            match_events = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-            match_events = pickle.load(match_events)
-            events_prev_below_df = pd.concat([events_prev_below_df, match_events])
-    elif '-playerdata-' in file:
-        if (file.split('-')[3] in all_teams) or (file.split('-')[4].replace('.pbz2','') in all_teams):
-            match_players = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-            match_players = pickle.load(match_players)
-            players_prev_below_df = pd.concat([players_prev_below_df, match_players])
-    else:
-        pass
+
+# Only load match files involving a team in the selected league
+files = matching_files(os.listdir(file_path), all_teams)
+
+events_prev_below_df, players_prev_below_df = load_match_data(file_path, files, 'delta-threat')
     
 # %% Get data for current year, league above selected league
 
@@ -150,30 +137,30 @@ players_prev_above_df = pd.DataFrame()
 if league_above != None:
     
     file_path = f"../../data_directory/whoscored_data/{year_before}_{str(int(str(year_before).replace('20','')) + 1)}/{league_above}"
-    files = os.listdir(file_path)
     
-    # Load data
-    for file in files:
-        if '-eventdata-' in file:
-            if (file.split('-')[3] in all_teams) or (file.split('-')[4].replace('.pbz2','') in all_teams):
-                match_events = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-                match_events = pickle.load(match_events)
-                events_prev_above_df = pd.concat([events_prev_above_df, match_events])
-        elif '-playerdata-' in file:
-            if (file.split('-')[3] in all_teams) or (file.split('-')[4].replace('.pbz2','') in all_teams):
-                match_players = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-                match_players = pickle.load(match_players)
-                players_prev_above_df = pd.concat([players_prev_above_df, match_players])
-        else:
-            pass
+    # Only load match files involving a team in the selected league
+    files = matching_files(os.listdir(file_path), all_teams)
+    
+    events_prev_above_df, players_prev_above_df = load_match_data(file_path, files, 'delta-threat')
 
 # %% Function to process data
 
 def process_event_data(events_in):
-    threat_creating_events = events_in[events_in['xThreat']==events_in['xThreat']]
-    threat_creating_events = threat_creating_events[~threat_creating_events['satisfiedEventsTypes'].apply(lambda x: True if (31 in x or 34 in x or 212 in x) else False)]
+    threat_creating = (events_in['xThreat'].notna().to_numpy() &
+                       events_in['satisfiedEventsTypes'].map(frozenset([31, 34, 212]).isdisjoint).to_numpy(dtype=bool))
+    threat_creating_events = events_in[threat_creating]
 
     return threat_creating_events, events_in
+
+
+def team_threat_totals(threat_events, events, team_ids):
+    """ Sum xT created and minutes played for each of team_ids, where minutes played is the length of each match in
+    which the team created threat. Teams without threat creating events are given zero totals."""
+    mins_per_match = events.groupby('match_id', sort=False)['cumulative_mins'].max()
+    team_matches = threat_events[['teamId', 'match_id']].drop_duplicates()
+    team_mins = team_matches['match_id'].map(mins_per_match).groupby(team_matches['teamId']).sum()
+    team_xt = threat_events.groupby('teamId')['xThreat_gen'].sum()
+    return pd.DataFrame({'mins_played': team_mins, 'xT': team_xt}).reindex(team_ids, fill_value=0)
     
 
 threat_creating_events_df, events_df = process_event_data(events_df)
@@ -184,53 +171,66 @@ if league_above != None:
 
 # %% Get teams and order on total threat created
 
-# Set up dictionary to store xt per 90 per team
-team_xt_df = pd.DataFrame(columns = ['team', 'mins_played', 'xT_90', 'mins_played_prev', 'xT_90_prev'])
+# Map each team to its id
+team_to_id = dict(players_df.drop_duplicates('team').set_index('team')['teamId'])
+team_ids = list(team_to_id.values())
+
+# Group threat creating events and aggregate totals by team, once for each source of data
+threat_groups = dict(tuple(threat_creating_events_df.groupby('teamId', sort=False)))
+team_totals = team_threat_totals(threat_creating_events_df, events_df, team_ids)
+threat_prev_groups = dict(tuple(threat_creating_events_prev_df.groupby('teamId', sort=False)))
+team_totals_prev = team_threat_totals(threat_creating_events_prev_df, events_prev_df, team_ids)
+threat_prev_below_groups = dict(tuple(threat_creating_events_prev_below_df.groupby('teamId', sort=False)))
+team_totals_prev_below = team_threat_totals(threat_creating_events_prev_below_df, events_prev_below_df, team_ids)
+if league_above != None:
+    threat_prev_above_groups = dict(tuple(threat_creating_events_prev_above_df.groupby('teamId', sort=False)))
+    team_totals_prev_above = team_threat_totals(threat_creating_events_prev_above_df, events_prev_above_df, team_ids)
+
+# Teams in each source of previous season data
+prev_teams = set(players_prev_df['team'].unique())
+prev_below_teams = set(players_prev_below_df['team'].unique())
+prev_above_teams = set(players_prev_above_df['team'].unique()) if league_above != None else set()
+
+# Set up list and dictionaries to store xt per 90 and events per team
+team_xt_rows = list()
 team_xt_events = dict.fromkeys(all_teams, 0)
 team_xt_events_prev = dict.fromkeys(all_teams, 0)
 
-for idx, team in enumerate(all_teams):
-    
-    # Store team in dataframe
-    team_xt_df.loc[idx, 'team'] = team
+for team in all_teams:
     
     # Get team events
-    team_id = players_df[players_df['team']==team]['teamId'].values[0]
-    team_threat_creating_events = threat_creating_events_df[threat_creating_events_df['teamId']==team_id]
-    
-    # Get each team match and accumulate total mins
-    team_matches = set(team_threat_creating_events['match_id'])
-    team_mins = 0
-    for match in team_matches:
-        team_mins += events_df[events_df['match_id']==match]['cumulative_mins'].max()
+    team_id = team_to_id[team]
+    team_threat_creating_events = threat_groups.get(team_id, threat_creating_events_df.iloc[:0])
+    team_mins = team_totals.loc[team_id, 'mins_played']
      
     # Check for team in current league
-    if team in set(players_prev_df['team']):
-        team_threat_creating_events_prev = threat_creating_events_prev_df[threat_creating_events_prev_df['teamId']==team_id]   
-        all_events_prev = events_prev_df.copy()
-    elif team in set(players_prev_below_df['team']):
-        team_threat_creating_events_prev = threat_creating_events_prev_below_df[threat_creating_events_prev_below_df['teamId']==team_id]  
-        all_events_prev = events_prev_below_df.copy()         
-    elif team in set(players_prev_above_df['team']):
-        team_threat_creating_events_prev = threat_creating_events_prev_above_df[threat_creating_events_prev_above_df['teamId']==team_id]   
-        all_events_prev = events_prev_above_df.copy()         
-
-    # Get each team prev. match and accumulate total mins
-    team_matches_prev = set(team_threat_creating_events_prev['match_id'])
-    team_mins_prev = 0
-    for match in team_matches_prev: 
-        team_mins_prev += all_events_prev[all_events_prev['match_id']==match]['cumulative_mins'].max()
-
-    # Store team mins played and  xT created per 90 in dataframe
-    team_xt_df.loc[idx, 'mins_played'] = team_mins
-    team_xt_df.loc[idx, 'mins_played_prev'] = team_mins_prev
-    team_xt_df.loc[idx, 'xT_90'] = 90*(team_threat_creating_events['xThreat_gen'].sum() / team_mins)
-    team_xt_df.loc[idx, 'xT_90_prev'] = 90*(team_threat_creating_events_prev['xThreat_gen'].sum() / team_mins_prev)
+    if team in prev_teams:
+        prev_events, prev_groups, prev_totals = threat_creating_events_prev_df, threat_prev_groups, team_totals_prev
+    elif team in prev_below_teams:
+        prev_events, prev_groups, prev_totals = (threat_creating_events_prev_below_df, threat_prev_below_groups,
+                                                 team_totals_prev_below)
+    elif team in prev_above_teams:
+        prev_events, prev_groups, prev_totals = (threat_creating_events_prev_above_df, threat_prev_above_groups,
+                                                 team_totals_prev_above)
+
+    # Get team prev. events and total mins
+    team_threat_creating_events_prev = prev_groups.get(team_id, prev_events.iloc[:0])
+    team_mins_prev = prev_totals.loc[team_id, 'mins_played']
+
+    # Store team mins played and  xT created per 90
+    team_xt_rows.append({'team': team,
+                         'mins_played': team_mins,
+                         'xT_90': 90*(team_totals.loc[team_id, 'xT'] / team_mins),
+                         'mins_played_prev': team_mins_prev,
+                         'xT_90_prev': 90*(prev_totals.loc[team_id, 'xT'] / team_mins_prev)})
     
     # Store events in appropriate dictionary
     team_xt_events[team] = team_threat_creating_events
     team_xt_events_prev[team] = team_threat_creating_events_prev
 
+# Build dataframe of xt per 90 per team in one go
+team_xt_df = pd.DataFrame(team_xt_rows)
+
 # %% Calc xT difference and order dataframe
 
 team_xt_df['xT_90_diff'] = team_xt_df['xT_90'] - team_xt_df['xT_90_prev']
@@ -267,28 +267,36 @@ fig.set_facecolor('#313332')
 ax['pitch'] = ax['pitch'].reshape(-1)
 idx = 0
 
+# Zone grid, computed once and used to bin every team's threat creating events on ascending edges
+zone_grid = pitch.bin_statistic([0], [0], statistic='sum', bins=(6, 5), normalize=False, values=[0])
+xedges, yedges, flip_rows = pz.zone_grid_edges(zone_grid)
+
+# Load team badges and colours once
+badges = {team: lab.get_team_badge_and_colour(team) for team in team_xt_df['team']}
+
 # Loop through each team
-for _, team_row in team_xt_df.iterrows():
+for team_row in team_xt_df.itertuples(index=False):
     
     # Get team name and events
-    team = team_row['team']
+    team = team_row.team
     team_threat_creating_events = team_xt_events[team]
     team_threat_creating_events_prev = team_xt_events_prev[team]
 
     # Get team logo and colour
-    team_logo, team_cmap = lab.get_team_badge_and_colour(team)
-
-    # Bin threat creating events and normalise per 90
-    bin_statistic = pitch.bin_statistic(team_threat_creating_events['x'], team_threat_creating_events['y'],
-                                        statistic='sum', bins=(6, 5), normalize=False, values = team_threat_creating_events['xThreat_gen'])
-    bin_statistic['statistic'] = (90*bin_statistic['statistic']/team_row['mins_played']).round(3)
-
-    bin_statistic_prev = pitch.bin_statistic(team_threat_creating_events_prev['x'], team_threat_creating_events_prev['y'],
-                                        statistic='sum', bins=(6, 5), normalize=False, values = team_threat_creating_events_prev['xThreat_gen'])
-    bin_statistic_prev['statistic'] = (90*bin_statistic_prev['statistic']/team_row['mins_played_prev']).round(3)
+    team_logo, team_cmap = badges[team]
+
+    # Bin threat creating events, flip rows to the zone grid order and normalise per 90
+    zone_xt, _, _ = np.histogram2d(team_threat_creating_events['x'].to_numpy(), team_threat_creating_events['y'].to_numpy(),
+                                   bins=[xedges, yedges], weights=team_threat_creating_events['xThreat_gen'].to_numpy())
+    zone_xt = np.flip(zone_xt.T, axis=0) if flip_rows else zone_xt.T
+    bin_statistic = dict(zone_grid, statistic=(90*zone_xt/team_row.mins_played).round(3))
+
+    zone_xt_prev, _, _ = np.histogram2d(team_threat_creating_events_prev['x'].to_numpy(), team_threat_creating_events_prev['y'].to_numpy(),
+                                        bins=[xedges, yedges], weights=team_threat_creating_events_prev['xThreat_gen'].to_numpy())
+    zone_xt_prev = np.flip(zone_xt_prev.T, axis=0) if flip_rows else zone_xt_prev.T
+    bin_statistic_prev = dict(zone_grid, statistic=(90*zone_xt_prev/team_row.mins_played_prev).round(3))
     
-    bin_statistic_change = bin_statistic.copy()
-    bin_statistic_change['statistic'] = bin_statistic['statistic'] - bin_statistic_prev['statistic']
+    bin_statistic_change = dict(zone_grid, statistic=bin_statistic['statistic'] - bin_statistic_prev['statistic'])
 
     # Draw heatmap
     pcm = pitch.heatmap(bin_statistic_change, ax['pitch'][idx], cmap=CustomCmap, edgecolor='w', lw=0.5, vmin= -0.04, vmax = 0.04, zorder=0, alpha=0.7)
@@ -301,18 +309,17 @@ for _, team_row in team_xt_df.iterrows():
     
     # Label xt
     ax['pitch'][idx].text(2, 12, f"xT/90 {int(year.replace('20','',1))}/{int(year.replace('20','',1))+1}:", fontsize=9, fontweight='bold', color='w', zorder=3, path_effects = path_eff)
-    ax['pitch'][idx].text(40, 12, round(team_row['xT_90'],2), fontsize=9, fontweight='bold', color='w', zorder=3, path_effects = path_eff)
+    ax['pitch'][idx].text(40, 12, round(team_row.xT_90,2), fontsize=9, fontweight='bold', color='w', zorder=3, path_effects = path_eff)
     ax['pitch'][idx].text(2, 2, f"xT/90 {int(year.replace('20','',1))-1}/{int(year.replace('20','',1))}:", fontsize=9, fontweight='bold', color='w', zorder=3, path_effects = path_eff)
-    ax['pitch'][idx].text(40, 2, round(team_row['xT_90_prev'],2), fontsize=9, fontweight='bold', color='w', zorder=3, path_effects = path_eff)
+    ax['pitch'][idx].text(40, 2, round(team_row.xT_90_prev,2), fontsize=9, fontweight='bold', color='w', zorder=3, path_effects = path_eff)
     
     # Set title
     ax['pitch'][idx].set_title(f"  {idx + 1}:  {team}", pad=2, loc = "left", color='w', fontsize = 16)
-            
-    ax_pos = ax['pitch'][idx].get_position()
-    
-    logo_ax = fig.add_axes([ax_pos.x1-0.02, ax_pos.y1, 0.02, 0.02])
-    logo_ax.axis("off")
-    logo_ax.imshow(team_logo)
+
+    # Add team logo above top right corner of pitch
+    ab = AnnotationBbox(OffsetImage(team_logo, zoom = 0.06, resample = True), (1, 1), xycoords='axes fraction',
+                        box_alignment=(1, 0), frameon=False)
+    ax['pitch'][idx].add_artist(ab)
     
     idx+=1
     
@@ -14,11 +14,63 @@ from PIL import Image, ImageEnhance
 import matplotlib.patheffects as path_effects
 import os
 import sys
-import bz2
-import pickle
 import numpy as np
 import matplotlib as mpl
 
+# %% Function definitions
+
+def window_counts(actions, events, by, flag_cols, window=5/60):
+    """ Count the events with each flag set from the time of each action to window minutes later, matching on the
+    columns in by and excluding events that share the action's eventId. Counts are differences of running flag totals,
+    read at the start and end of each window with forward and backward as-of joins."""
+
+    # Running flag totals within each group, before and after each event in time order (events without a time or group
+    # can't fall in any window)
+    events = (events.dropna(subset=by + ['cumulative_mins']).sort_values('cumulative_mins', kind='stable')
+              .reset_index(drop=True))
+    totals_after = events[flag_cols].groupby([events[col] for col in by]).cumsum()
+    totals_before = totals_after - events[flag_cols]
+    events_after = events[by + ['cumulative_mins']].join(totals_after).rename(columns={'cumulative_mins': 'window_end'})
+    events_before = events[by + ['cumulative_mins']].join(totals_before)
+
+    # Totals before the first event at or after the window start, and after the last event at or before its end
+    # (actions without a time or group are left with zero counts)
+    windows = actions[by + ['eventId', 'cumulative_mins']].dropna(subset=by + ['cumulative_mins']).reset_index()
+    windows['window_end'] = windows['cumulative_mins'] + window
+    start = pd.merge_asof(windows[['index', 'cumulative_mins'] + by].sort_values('cumulative_mins'), events_before,
+                          on='cumulative_mins', by=by, direction='forward').set_index('index')[flag_cols]
+    end = pd.merge_asof(windows[['index', 'window_end'] + by].sort_values('window_end'), events_after,
+                        on='window_end', by=by, direction='backward').set_index('index')[flag_cols]
+    counts = (end - start).reindex(actions.index).fillna(0)
+
+    # Remove events within the window that share the action's eventId
+    same_id = windows.merge(events[by + ['eventId', 'cumulative_mins'] + flag_cols], on=by + ['eventId'],
+                            suffixes=('', '_event'))
+    same_id = same_id[(same_id['cumulative_mins_event'] >= same_id['cumulative_mins']) &
+                      (same_id['cumulative_mins_event'] <= same_id['window_end'])]
+    counts -= same_id.groupby('index')[flag_cols].sum().reindex(actions.index, fill_value=0)
+
+    return counts
+
+
+def build_match_data(file_path, files):
+    """ Load event and player data from match files and add team names, downcasting period and storing low cardinality
+    descriptors as categoricals."""
+    match_data = list(zip(files, wde.load_files(file_path, files)))
+
+    # Build dataframes with a single concatenation each
+    events_df = pd.concat([data for file, data in match_data if '-eventdata-' in file])
+    players_df = pd.concat([data for file, data in match_data if '-playerdata-' in file])
+
+    # Add team names
+    events_df = wde.add_team_name(events_df, players_df)
+
+    # Downcast period, and store low cardinality descriptors as categoricals
+    events_df = events_df.astype({'period': 'int8', 'eventType': 'category', 'team_name': 'category',
+                                  'opp_team_name': 'category'})
+
+    return events_df, players_df
+
 # %% Add custom tools to path
 
 root_folder = os.path.abspath(os.path.dirname(
@@ -54,38 +106,19 @@ comp_logo = lab.get_competition_logo(league, year, logo_brighten=logo_brighten)
 # %% Get data
 
 file_path = f"../../data_directory/whoscored_data/{year}_{str(int(year.replace('20','')) + 1)}/{league}"
-files = os.listdir(file_path)
-
-# Initialise storage dataframes
-events_df = pd.DataFrame()
-players_df = pd.DataFrame()
-
-# Load data
-for file in files:
-    if file == 'event-types.pbz2':
-        event_types = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        event_types = pickle.load(event_types)
-    elif file == 'formation-mapping.pbz2':
-        formation_mapping = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        formation_mapping = pickle.load(formation_mapping)
-    elif '-eventdata-' in file:
-        match_events = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        match_events = pickle.load(match_events)
-        events_df = pd.concat([events_df, match_events])
-    elif '-playerdata-' in file:
-        match_players = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        match_players = pickle.load(match_players)
-        players_df = pd.concat([players_df, match_players])
-    else:
-        pass
-
-# %% Get cumulative minutes info
-
-events_df = wde.add_team_name(events_df, players_df)
+files = [file for file in os.listdir(file_path) if file.endswith('.pbz2')]
+
+# Read processed data from cache if source files and processing are unchanged since last run, keeping only the event
+# and player columns used in this analysis
+events_df, players_df = wde.load_cached_data(file_path, files, 'setpiece-concession', build_match_data,
+                                             event_cols=['match_id', 'period', 'eventId', 'teamId', 'cumulative_mins',
+                                                         'eventType', 'isGoal', 'isOwnGoal', 'isShot', 'blockedX',
+                                                         'satisfiedEventsTypes', 'team_name', 'opp_team_name'],
+                                             player_cols=['team', 'teamId'])
 
 # %% Get free-kicks and corners (Selecting "indirect" only for purpose of this work)
 
-all_fks_and_corners = events_df[events_df['satisfiedEventsTypes'].apply(lambda x: True if (31 in x or 34 in x or 6 in x or 5 in x) else False)]
+all_fks_and_corners = events_df[~events_df['satisfiedEventsTypes'].map(frozenset([31, 34, 6, 5]).isdisjoint)]
 
 fks_and_corners = all_fks_and_corners[(all_fks_and_corners['eventType']=='Pass') |
                                       (all_fks_and_corners['eventType']=='SavedShot') |
@@ -93,41 +126,40 @@ fks_and_corners = all_fks_and_corners[(all_fks_and_corners['eventType']=='Pass')
 
 # %% Determine set piece outcome (over 5s) and add to dataframe
 
-# Add new column to categorise cross
-fks_and_corners['set_piece_outcome'] = np.nan
+fks_and_corners = fks_and_corners.reset_index(drop=True)
 
-for idx, set_piece in fks_and_corners.iterrows():
-    next_evts = events_df[(events_df['match_id'] == set_piece['match_id']) & (events_df['period'] == set_piece['period']) & (events_df['eventId'] != set_piece['eventId']) & (events_df['cumulative_mins'] >= set_piece['cumulative_mins']) & (events_df['cumulative_mins'] <= set_piece['cumulative_mins']+(5/60))]
-    team_next_evts = next_evts[next_evts['teamId'] == set_piece['teamId']]
-    opp_next_evts = next_evts[next_evts['teamId'] != set_piece['teamId']]
-    if (True in team_next_evts['isGoal'].tolist()) or (True in opp_next_evts['isOwnGoal'].tolist()):
-        fks_and_corners.loc[idx, 'set_piece_outcome'] = 'Goal'
-    elif (True in team_next_evts['isShot'].tolist()) or ('ChanceMissed' in team_next_evts['eventType'].tolist()) or ('Foul' in opp_next_evts['isOwnGoal'].tolist()):
-        fks_and_corners.loc[idx, 'set_piece_outcome'] = 'Chance'
-    elif set_piece['isShot']==True:
-        fks_and_corners.loc[idx, 'set_piece_outcome'] = 'Direct Shot Only'
+# Flag goals, own goals, shots and missed chances across all events
+event_flags = events_df[['match_id', 'period', 'teamId', 'eventId', 'cumulative_mins']].assign(
+    goal=(events_df['isGoal'] == True).astype(int), own_goal=(events_df['isOwnGoal'] == True).astype(int),
+    shot=(events_df['isShot'] == True).astype(int), chance_missed=(events_df['eventType'] == 'ChanceMissed').astype(int))
+
+# Count flagged events by the set piece team, and by all teams, in the 5s following each set piece
+team_next_counts = window_counts(fks_and_corners, event_flags, ['match_id', 'period', 'teamId'],
+                                 ['goal', 'own_goal', 'shot', 'chance_missed'])
+all_next_own_goals = window_counts(fks_and_corners, event_flags, ['match_id', 'period'], ['own_goal'])['own_goal']
+opp_next_own_goals = all_next_own_goals - team_next_counts['own_goal']
+
+# Add new column to categorise set piece
+fks_and_corners['set_piece_outcome'] = np.select([(team_next_counts['goal'] > 0) | (opp_next_own_goals > 0),
+                                                  (team_next_counts['shot'] > 0) | (team_next_counts['chance_missed'] > 0),
+                                                  fks_and_corners['isShot'] == True],
+                                                 ['Goal', 'Chance', 'Direct Shot Only'], default=None)
 
 # %% Get teams and create a dataframe of set piece information
 
 # Sort alphabetically initially
 teams = sorted(set(players_df['team']))
 
-# Set up dataframe to store set piece concession per team
-team_sp_concede_df = pd.DataFrame(columns = ['team','matches_played','sp_concede', 'sp_chance_concede', 'sp_goal_concede'])
+# Flag set pieces resulting in a chance or goal
+sp_chance = fks_and_corners['set_piece_outcome'].isin(['Goal', 'Chance'])
+sp_goal = fks_and_corners['set_piece_outcome'].isin(['Goal', 'Direct Goal'])
 
-for idx, team in enumerate(teams):
-    
-    # Get team set pieces against
-    team_sp_concede = fks_and_corners[fks_and_corners['opp_team_name']==team]
-    team_sp_chance_concede = team_sp_concede[team_sp_concede['set_piece_outcome'].isin(['Goal', 'Chance'])]                           
-    team_sp_goal_concede = team_sp_concede[team_sp_concede['set_piece_outcome'].isin(['Goal', 'Direct Goal'])]                           
-    
-    # Add information to df
-    team_sp_concede_df.loc[idx, 'team'] = team
-    team_sp_concede_df.loc[idx, 'matches_played'] = len(set(events_df[events_df['team_name']==team]['match_id']))
-    team_sp_concede_df.loc[idx, 'sp_concede'] = len(team_sp_concede)
-    team_sp_concede_df.loc[idx, 'sp_chance_concede'] = len(team_sp_chance_concede)
-    team_sp_concede_df.loc[idx, 'sp_goal_concede'] = len(team_sp_goal_concede)
+# Set up dataframe of matches played and set pieces conceded per team, with one groupby per measure
+team_sp_concede_df = pd.DataFrame({'matches_played': events_df.groupby('team_name')['match_id'].nunique(),
+                                   'sp_concede': fks_and_corners.groupby('opp_team_name').size(),
+                                   'sp_chance_concede': fks_and_corners[sp_chance].groupby('opp_team_name').size(),
+                                   'sp_goal_concede': fks_and_corners[sp_goal].groupby('opp_team_name').size()})
+team_sp_concede_df = team_sp_concede_df.reindex(teams, fill_value=0).fillna(0).astype(int).rename_axis('team').reset_index()
 
 # %% Calculations per match and pct
 
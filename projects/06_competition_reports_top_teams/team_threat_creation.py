@@ -16,13 +16,27 @@ from mplsoccer.pitch import VerticalPitch, Pitch
 import matplotlib.patheffects as path_effects
 import os
 import sys
-import bz2
-import pickle
 import numpy as np
 from collections import Counter
 import highlight_text as htext
 import glob
 
+# %% Function definitions
+
+def build_match_data(file_path, files):
+    """ Load event and player data from match files, downcasting threat, coordinate and time columns to float32."""
+    match_data = list(zip(files, wde.load_files(file_path, files)))
+
+    # Build dataframes with a single concatenation each
+    events_df = pd.concat([data for file, data in match_data if '-eventdata-' in file])
+    players_df = pd.concat([data for file, data in match_data if '-playerdata-' in file])
+
+    # Downcast threat, coordinate and time columns to float32
+    events_df = events_df.astype({'teamId': 'int32', 'x': 'float32', 'y': 'float32', 'cumulative_mins': 'float32',
+                                  'xThreat': 'float32', 'xThreat_gen': 'float32'})
+
+    return events_df, players_df
+
 # %% Add custom tools to path
 
 root_folder = os.path.abspath(os.path.dirname(
@@ -61,60 +75,40 @@ comp_logo = lab.get_competition_logo(league, year, logo_brighten=logo_brighten)
 # %% Get data for current year
 
 file_path = f"../../data_directory/whoscored_data/{year}_{str(int(year.replace('20','')) + 1)}/{league}"
-files = os.listdir(file_path)
-
-# Initialise storage dataframes
-events_df = pd.DataFrame()
-players_df = pd.DataFrame()
-
-# Load data
-for file in files:
-    if file == 'event-types.pbz2':
-        event_types = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        event_types = pickle.load(event_types)
-    elif file == 'formation-mapping.pbz2':
-        formation_mapping = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        formation_mapping = pickle.load(formation_mapping)
-    elif '-eventdata-' in file:
-        match_events = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        match_events = pickle.load(match_events)
-        events_df = pd.concat([events_df, match_events])
-    elif '-playerdata-' in file:
-        match_players = bz2.BZ2File(f"{file_path}/{file}", 'rb')
-        match_players = pickle.load(match_players)
-        players_df = pd.concat([players_df, match_players])
-    else:
-        pass
+files = [file for file in os.listdir(file_path) if file.endswith('.pbz2')]
+
+# Read loaded data from cache if source files and processing are unchanged since last run, keeping only the event and
+# player columns used in this analysis
+events_df, players_df = wde.load_cached_data(file_path, files, 'threat-creation', build_match_data,
+                                             event_cols=['match_id', 'teamId', 'x', 'y', 'cumulative_mins', 'xThreat',
+                                                         'xThreat_gen', 'satisfiedEventsTypes'],
+                                             player_cols=['team', 'teamId'])
 
 
 # %% Isolate events of choice (in play only)
 
 threat_creating_events_df = events_df[events_df['xThreat']==events_df['xThreat']]
-threat_creating_events_df = threat_creating_events_df[~threat_creating_events_df['satisfiedEventsTypes'].apply(lambda x: True if (31 in x or 34 in x or 212 in x) else False)]
+threat_creating_events_df = threat_creating_events_df[threat_creating_events_df['satisfiedEventsTypes'].map(frozenset([31, 34, 212]).isdisjoint)]
 
 # %% Get teams and order on total threat created
 
 # Sort alphabetically initially
 teams = sorted(set(players_df['team']))
 
-# Set up dictionary to store xt per 90 per team
-team_xt_90 = dict.fromkeys(teams, 0)
 team_count = len(teams)
 
-for team in teams:
-    
-    # Get team events
-    team_id = players_df[players_df['team']==team]['teamId'].values[0]
-    team_threat_creating_events = threat_creating_events_df[threat_creating_events_df['teamId']==team_id]
-    
-    # Get each team match and accumulate total mins
-    team_matches = set(team_threat_creating_events['match_id'])
-    team_mins = 0
-    for match in team_matches:
-        team_mins += events_df[events_df['match_id']==match]['cumulative_mins'].max()
-      
-    # Team xT created per 90
-    team_xt_90[team] = 90*(team_threat_creating_events['xThreat_gen'].sum() / team_mins)
+# Team id lookup, built once
+team_to_id = dict(players_df.drop_duplicates('team').set_index('team')['teamId'])
+
+# Total xT and minutes played per team id, where minutes played is the length of each match in which the team created
+# threat
+mins_per_match = events_df.groupby('match_id', sort=False)['cumulative_mins'].max()
+team_matches = threat_creating_events_df[['teamId', 'match_id']].drop_duplicates()
+team_mins = team_matches['match_id'].map(mins_per_match).groupby(team_matches['teamId']).sum()
+team_xt = threat_creating_events_df.groupby('teamId')['xThreat_gen'].sum()
+
+# Team xT created per 90
+team_xt_90 = {team: 90*(team_xt.get(team_to_id[team], 0) / team_mins.get(team_to_id[team], np.nan)) for team in teams}
 
 # Sort dictionary by xT/90
 team_xt_90 = sorted(team_xt_90.items(), key=lambda x: x[1], reverse=True)
@@ -44,22 +44,36 @@ matches_df = data_dict['matches']
 lineups_df = data_dict['lineups']
 playerstats_df = data_dict['player_stats']
 
+# Opposition team for each event, from the teams involved in its match
+event_match_teams = events_df[['match_id']].merge(matches_df[['match_id', 'home_team', 'away_team']], on='match_id', how='left')
+home_team = event_match_teams['home_team'].to_numpy()
+away_team = event_match_teams['away_team'].to_numpy()
+event_team = events_df['team_name'].to_numpy()
+events_df['opponent_team'] = np.where(event_team == home_team, away_team, np.where(event_team == away_team, home_team, None))
+
+# Keep only the event columns used in this analysis, storing low cardinality descriptors as categoricals
+events_df = events_df[['match_id', 'period', 'cumulative_mins', 'team_name', 'opponent_team', 'type_name', 'outcome_name',
+                       'in_play_event', 'shot_statsbomb_xg', 'obv_for_net_z']]
+events_df = events_df.astype({'type_name': 'category', 'outcome_name': 'category'})
+
+# Downcast numeric columns, halving the bytes moved by every reduction
+events_df = events_df.astype({'match_id': 'int32', 'period': 'int8', 'cumulative_mins': 'float32',
+                              'shot_statsbomb_xg': 'float32', 'obv_for_net_z': 'float32'})
+
 # Logo
 comp_logo = lab.get_competition_logo(data_grab[0][1], data_grab[0][2], logo_brighten=True)
 
 # %% Error metrics
 
 all_errors = events_df[events_df['type_name']=='Error']
-events_following_error = pd.DataFrame()
 
-for idx, error in all_errors.iterrows():
-    
-    error_evts = events_df[(events_df['match_id']==error['match_id']) &
-                            (events_df['period']==error['period']) & 
-                            (events_df['cumulative_mins'] >= error['cumulative_mins']) &
-                            (events_df['cumulative_mins'] <= error['cumulative_mins'] + (15/60)) & 
-                            (events_df['team_name']!=error['team_name'])]
-    events_following_error = pd.concat([events_following_error, error_evts])
+# Pair every event with each error in the same match and period, then keep opposition events within 15s of the error
+error_windows = all_errors[['match_id', 'period', 'cumulative_mins', 'team_name']].rename(
+    columns={'cumulative_mins': 'error_mins', 'team_name': 'error_team'})
+error_event_pairs = events_df.merge(error_windows, on=['match_id', 'period'], how='inner')
+events_following_error = error_event_pairs[(error_event_pairs['cumulative_mins'] >= error_event_pairs['error_mins']) &
+                                           (error_event_pairs['cumulative_mins'] <= error_event_pairs['error_mins'] + (15/60)) &
+                                           (error_event_pairs['team_name'] != error_event_pairs['error_team'])].drop(columns=['error_mins', 'error_team'])
     
 # %% Get team information
 
@@ -79,26 +93,19 @@ ip_obv_events = events_df[(events_df['type_name'].isin(['Pass','Carry','Dribble'
                           (events_df['in_play_event']==1)]
 teaminfo_df = sde.group_team_events(ip_obv_events, teaminfo_df, group_type='sum', agg_columns ='obv_for_net_z', primary_event_name = 'ip_xt_for')
 
-# In-play shots, goals and xG against
-for team_name, _ in teaminfo_df.iterrows():
-    
-    # Get matches and events by team
-    match_ids = matches_df[(matches_df['home_team']==team_name) | (matches_df['away_team']==team_name)]['match_id'].tolist()
-    team_match_evts = events_df[events_df['match_id'].isin(match_ids)]
-    evts_against = team_match_evts[team_match_evts['team_name']!=team_name]
-    shots_against = evts_against[evts_against['type_name']=='Shot']
-    ip_shots_against = shots_against[shots_against['in_play_event']==1]
-    ip_goals_against = pd.concat([ip_shots_against[ip_shots_against['outcome_name']=='Goal'], evts_against[evts_against['type_name']=='Own Goal For']])
-    ip_obv_events_against = evts_against[(evts_against['type_name'].isin(['Pass','Carry','Dribble'])) &
-                                         (evts_against['in_play_event']==1)]
-    teaminfo_df.loc[team_name, 'xg_against'] = shots_against['shot_statsbomb_xg'].sum(numeric_only=True)
-    teaminfo_df.loc[team_name, 'ip_xg_against'] = ip_shots_against['shot_statsbomb_xg'].sum(numeric_only=True)
-    teaminfo_df.loc[team_name, 'ip_goals_against'] = len(ip_goals_against)    
-    teaminfo_df.loc[team_name, 'ip_xt_against'] = ip_obv_events_against['obv_for_net_z'].sum(numeric_only=True)
-    
-    team_post_error_evts_against = events_following_error[(events_following_error['match_id'].isin(match_ids)) & (events_following_error['team_name']!=team_name)]
-    post_error_shots_against = team_post_error_evts_against[(team_post_error_evts_against['type_name']=='Shot') & (team_post_error_evts_against['in_play_event']==1)] 
-    teaminfo_df.loc[team_name, 'xg_against_following_error'] = post_error_shots_against['shot_statsbomb_xg'].sum(numeric_only=True)
+# In-play shots, goals and xG against, grouped by the opposition of the team taking each action
+shots_against = events_df[events_df['type_name']=='Shot']
+ip_shots_against = shots_against[shots_against['in_play_event']==1]
+ip_goals_against = pd.concat([ip_shots_against[ip_shots_against['outcome_name']=='Goal'], events_df[events_df['type_name']=='Own Goal For']])
+ip_obv_events_against = events_df[(events_df['type_name'].isin(['Pass','Carry','Dribble'])) &
+                                  (events_df['in_play_event']==1)]
+teaminfo_df['xg_against'] = shots_against.groupby('opponent_team')['shot_statsbomb_xg'].sum().reindex(teaminfo_df.index, fill_value=0)
+teaminfo_df['ip_xg_against'] = ip_shots_against.groupby('opponent_team')['shot_statsbomb_xg'].sum().reindex(teaminfo_df.index, fill_value=0)
+teaminfo_df['ip_goals_against'] = ip_goals_against.groupby('opponent_team').size().reindex(teaminfo_df.index, fill_value=0)
+teaminfo_df['ip_xt_against'] = ip_obv_events_against.groupby('opponent_team')['obv_for_net_z'].sum().reindex(teaminfo_df.index, fill_value=0)
+
+post_error_shots_against = events_following_error[(events_following_error['type_name']=='Shot') & (events_following_error['in_play_event']==1)]
+teaminfo_df['xg_against_following_error'] = post_error_shots_against.groupby('opponent_team')['shot_statsbomb_xg'].sum().reindex(teaminfo_df.index, fill_value=0)
 
 teaminfo_df['non-error_ip_xg_against'] =  teaminfo_df['ip_xg_against'] - teaminfo_df['xg_against_following_error']
 teaminfo_df['xg_difference'] =  teaminfo_df['xg_for'] - teaminfo_df['xg_against']
@@ -120,6 +127,10 @@ for column in teaminfo_df.columns:
     if ('xg' in column or 'xt' in column) and ('ratio' not in column):
         teaminfo_df[column + '_90'] =  90*teaminfo_df[column] /  teaminfo_df['time_played']
         
+# %% Load team badges
+
+badges = {team: lab.get_team_badge_and_colour(team) for team in teaminfo_df.index}
+
 # %% VISUAL 1: XG AND XT RATIO SCATTER
 
 # rc params
@@ -156,13 +167,13 @@ ax.set_xlim([xmin.values, xmax.values])
 ax.set_ylim([ymin.values, ymax.values])
 
 # Iterate through each team
-for team, team_metrics in teaminfo_df.iterrows():
+for team, (team_x, team_y) in zip(teaminfo_df.index, teaminfo_df[[plot_x[0], plot_y[0]]].to_numpy()):
     
     # Get logo
-    team_logo, _ = lab.get_team_badge_and_colour(team)
+    team_logo, _ = badges[team]
     
     # Plot logo
-    ab = AnnotationBbox(OffsetImage(team_logo, zoom = 0.07, resample = True), (team_metrics[plot_x], team_metrics[plot_y]), frameon=False)    
+    ab = AnnotationBbox(OffsetImage(team_logo, zoom = 0.07, resample = True), (team_x, team_y), frameon=False)    
     ax.add_artist(ab)
     
 # %% VISUAL 2: XG AND XT RATIO TABLE
@@ -204,24 +215,24 @@ ax.plot([0.999, 0.999], [-0.02, 0.995], color='w', zorder = 2)
 
 # Iterate through each team
 idx = 0
-for team, team_metrics in teaminfo_df.iterrows():
+for team, (xg_xt_ratio, goal_xg_ratio) in zip(teaminfo_df.index, teaminfo_df[['ip_xg_xt_ratio', 'ip_goal_xg_ratio']].to_numpy()):
     
     # Plot team name and badge
     ax.text(0.025 ,0.9*(1-idx/19), idx+1, va="center", ha = "center", color = "w" )
     ax.text(0.11 ,0.9*(1-idx/19), team, va="center", color = "w" )
-    team_logo, _ = lab.get_team_badge_and_colour(team)
+    team_logo, _ = badges[team]
     ab = AnnotationBbox(OffsetImage(team_logo, zoom = 0.06, resample = True), (0.08,0.9*(1-idx/19)+0.003), frameon=False)    
     ax.add_artist(ab)
 
     # Plot metrics
-    ax.text(0.5875 ,0.9*(1-idx/19), round(team_metrics['ip_xg_xt_ratio'],2), va="center", ha = "center", color = "w" )
-    ax.text(0.8625 ,0.9*(1-idx/19), round(team_metrics['ip_goal_xg_ratio'],2), va="center", ha = "center", color = "w" )
-
-    # Plot hline
-    ax.plot([0, 1], [0.9*(1-idx/19)-0.02, 0.9*(1-idx/19)-0.02], color='grey', lw = 0.5, zorder = 1)
+    ax.text(0.5875 ,0.9*(1-idx/19), round(xg_xt_ratio,2), va="center", ha = "center", color = "w" )
+    ax.text(0.8625 ,0.9*(1-idx/19), round(goal_xg_ratio,2), va="center", ha = "center", color = "w" )
   
     idx+=1
 
+# Plot row separators in a single call
+ax.hlines(0.9*(1-np.arange(len(teaminfo_df))/19)-0.02, 0, 1, color='grey', lw = 0.5, zorder = 1)
+
 # Format axis
 ax.spines['top'].set_visible(False) 
 ax.spines['right'].set_visible(False) 